@@ -1,13 +1,63 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import argparse
+import array
 import collections
+import hashlib
+import importlib
+import json
 import os
 import os.path
 import pathlib
 import re
+import select
 import shlex
+import signal
+import socket
 import sys
+import time
+
+# shared helpers in <skel root>/share/pym (symlinks to this script resolved)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'share', 'pym'))
+
+from aenv_trace import Tracer
+
+
+# default for AENV_PATHLIST_WARN
+PATHLIST_WARN_DEFAULT = 100
+
+# <root>/<dirname> => pathlike var, see main_init_env_ansible_common()
+ENV_ROOT_DIRS = [
+    ('AENV_FILES_PATH',             'files'),
+    # ANSIBLE_COLLECTIONS_PATH -- new name in Ansible 2.10,
+    # old name can still be used:
+    ('ANSIBLE_COLLECTIONS_PATHS',   'collections'),
+    ('ANSIBLE_ROLES_PATH',          'roles'),
+    ('PYTHONPATH',                  'pym'),
+]
+
+# <root>/plugins/<dirname> => pathlike var, see main_init_env_ansible_common()
+ENV_PLUGIN_DIRS = [
+    ('ANSIBLE_DOC_FRAGMENT_PLUGINS',    'doc_fragment'),
+    ('ANSIBLE_ACTION_PLUGINS',          'action'),
+    ('ANSIBLE_BECOME_PLUGINS',          'become'),
+    ('ANSIBLE_CACHE_PLUGINS',           'cache'),
+    ('ANSIBLE_CALLBACK_PLUGINS',        'callback'),
+    ('ANSIBLE_CLICONF_PLUGINS',         'cliconf'),
+    ('ANSIBLE_CONNECTION_PLUGINS',      'connection'),
+    ('ANSIBLE_FILTER_PLUGINS',          'filter'),
+    ('ANSIBLE_HTTPAPI_PLUGINS',         'httpapi'),
+    ('ANSIBLE_INVENTORY_PLUGINS',       'inventory'),
+    ('ANSIBLE_LIBRARY',                 'modules'),
+    ('ANSIBLE_LOOKUP_PLUGINS',          'lookup'),
+    ('ANSIBLE_MODULE_UTILS',            'module_utils'),
+    ('ANSIBLE_NETCONF_PLUGINS',         'netconf'),
+    ('ANSIBLE_STRATEGY_PLUGINS',        'strategy'),
+    ('ANSIBLE_TERMINAL_PLUGINS',        'terminal'),
+    ('ANSIBLE_TEST_PLUGINS',            'test'),
+    ('ANSIBLE_VARS_PLUGINS',            'vars'),
+]
 
 
 def is_scalar(arg):
@@ -27,6 +77,13 @@ class EnvBuilder(object):
         self.base_env  = base_env
         self.extra_env = {}
         self._cached_pathlike = {}
+        # pathlike entries added to base_env: <varname> => (<prefix>, <suffix>)
+        self._pathlike_extra = {}
+        # dedup diagnostics: <varname> => list of (<entry>, <reason>)
+        self.pathlike_dropped = {}
+        # entries per pathlike var after dedup: <varname> => <count>
+        self.pathlike_len = {}
+        self._realpath_cache = {}
 
     def __setitem__(self, key, value):
         self.extra_env[key] = value
@@ -53,11 +110,61 @@ class EnvBuilder(object):
             return (value is not None)
     # --- end of __contains__ (...) ---
 
+    def _get_realpath(self, value):
+        try:
+            return self._realpath_cache[value]
+        except KeyError:
+            # empty entries refer to the current directory, keep them as-is
+            rpath = (os.path.realpath(value) if value else value)
+            self._realpath_cache[value] = rpath
+            return rpath
+    # --- end of _get_realpath (...) ---
+
+    def dedup_pathlike(self, values, dropped=None):
+        """Removes duplicate entries from a path list, keeping the first one
+        (= highest precedence). Entries are compared by their realpath.
+
+        Dropped entries are appended to the dropped list (if given)
+        as (<entry>, <reason>) tuples.
+        """
+        kept_entries = {}   # realpath => first entry
+        result       = []
+
+        for value in values:
+            str_value = str(value)
+            rpath     = self._get_realpath(str_value)
+
+            try:
+                kept = kept_entries[rpath]
+
+            except KeyError:
+                kept_entries[rpath] = str_value
+                result.append(str_value)
+
+            else:
+                if dropped is not None:
+                    dropped.append((
+                        str_value,
+                        ('duplicate' if kept == str_value else f'same realpath as {kept}')
+                    ))
+            # --
+        # --
+
+        return result
+    # --- end of dedup_pathlike (...) ---
+
     def commit(self):
-        self.extra_env.update((
-            (varname, ':'.join(map(str, values)))
-            for varname, values in self._cached_pathlike.items()
-        ))
+        for varname, values in self._cached_pathlike.items():
+            dropped = []
+            dedup_values = self.dedup_pathlike(values, dropped)
+
+            self.extra_env[varname] = ':'.join(dedup_values)
+            self.pathlike_len[varname] = len(dedup_values)
+
+            if dropped:
+                self.pathlike_dropped.setdefault(varname, []).extend(dropped)
+        # --
+
         self._cached_pathlike.clear()
     # --- end of commit (...) ---
 
@@ -99,23 +206,72 @@ class EnvBuilder(object):
         return value
     # --- end of _get_pathlike (...) ---
 
+    def _get_pathlike_extra(self, key):
+        try:
+            return self._pathlike_extra[key]
+        except KeyError:
+            extra = (collections.deque(), [])
+            self._pathlike_extra[key] = extra
+            return extra
+    # --- end of _get_pathlike_extra (...) ---
+
     def pathlike_push(self, key, values):
         pathlike = self._get_pathlike(key)
+        prefix   = self._get_pathlike_extra(key)[0]
+
         if is_scalar(values):
             pathlike.appendleft(values)
+            prefix.appendleft(values)
         else:
             pathlike.extendleft(reversed(values))
+            prefix.extendleft(reversed(values))
     # ---
 
     def pathlike_append(self, key, values):
         pathlike = self._get_pathlike(key)
+        suffix   = self._get_pathlike_extra(key)[1]
 
         if is_scalar(values):
             pathlike.append(values)
+            suffix.append(values)
         else:
             pathlike.extend(values)
+            suffix.extend(values)
     # ---
 
+    def iter_export_env(self):
+        """Generates the project-specific environment changes
+        relative to base_env as (varname, action, value) tuples:
+
+          - (varname, 'set', <str>)
+          - (varname, 'unset', None)
+          - (varname, 'pathlike', (<prefix list>, <suffix list>))
+        """
+        self.commit()
+
+        for varname in sorted(self.extra_env):
+            value = self.extra_env[varname]
+
+            if varname in self._pathlike_extra:
+                prefix, suffix = self._pathlike_extra[varname]
+                # dedup prefix + suffix, the base value is only known when sourcing
+                dedup_prefix = self.dedup_pathlike(prefix)
+                prefix_rpaths = {self._get_realpath(v) for v in dedup_prefix}
+                dedup_suffix = [
+                    v for v in self.dedup_pathlike(suffix)
+                    if self._get_realpath(v) not in prefix_rpaths
+                ]
+
+                yield (varname, 'pathlike', (dedup_prefix, dedup_suffix))
+
+            elif value is None:
+                yield (varname, 'unset', None)
+
+            else:
+                yield (varname, 'set', str(value))
+        # --
+    # --- end of iter_export_env (...) ---
+
 # --- end of EnvBuilder ---
 
 
@@ -135,7 +291,9 @@ class RunConfig(object):
         'ansible-test',
         'ansible-vault',
 
-        'env', 'env-diff',
+        'env', 'env-diff', 'env-paths',
+
+        'ansible-playbook-sharded',
     }
 
     BUILTIN_WRAPPERS_NOINSTALL = {
@@ -167,6 +325,7 @@ class RunConfig(object):
         'ansible',
         'ansible-inventory',
         'ansible-playbook',
+        'ansible-playbook-sharded',
 
         # helper scripts
         'repo-inventory',
@@ -290,321 +449,3009 @@ class RunConfig(object):
         return None
     # --- end of find_default_inventory (...) ---
 
-# --- end of RunConfig ---
+    def get_env_fingerprint_paths(self):
+        # paths whose mtimes determine the computed environment:
+        # directory mtimes change when entries get added/removed,
+        # which covers the is_dir() / is_file() checks done while scanning
+        # (but not changes behind symlinked subdirectories)
+        fpaths = [self.script_file]
+        fpaths.extend(self.script_searchpath)
+
+        for root in filter(None, [self.skel_prjroot, self.ansible_prjroot]):
+            fpaths.append(root)
+            fpaths.append(root / 'plugins')
+            fpaths.append(root / 'local')
+        # --
 
+        if self.ansible_prjroot:
+            custom_collections_dir = self.ansible_prjroot / 'dust'
+            fpaths.append(custom_collections_dir)
 
-def main(prog, argv):
-    config = RunConfig()
+            if custom_collections_dir.is_dir():
+                for ent in sorted(custom_collections_dir.iterdir()):
+                    fpaths.append(ent)
+                    fpaths.append(ent / 'plugins')
+            # --
+        # --
 
-    config.script_called = pathlib.Path(__file__)
-    # do not resolve symlinks..
-    config.script_called_dir = pathlib.Path(os.path.abspath(config.script_called.parent))
+        # default inventory
+        inventory_root = self.inventory_root
+        fpaths.append(inventory_root)
+        fpaths.append(inventory_root / 'default')
+
+        default_inventory = self.find_default_inventory()
+        if default_inventory is not None:
+            fpaths.append(default_inventory.parent)
+
+        # profile files (for --export-env, not part of the cached env)
+        fpaths.extend(RunProfile.get_profile_files(self, default_inventory))
+
+        return fpaths
+    # --- end of get_env_fingerprint_paths (...) ---
+
+    def get_env_export_check_paths(self):
+        """Returns the paths that determine the exported environment,
+        as tuple (<mtime paths>, <probe paths>):
+
+          - mtime paths: files whose content matters
+            and directories whose entries get iterated
+          - probe paths: paths that only get checked via is_dir() / is_file()
+
+        Unlike get_env_fingerprint_paths(), this does not include
+        the project root and local/ directories themselves,
+        so that unrelated files created there (e.g. editor swap files)
+        do not mark the exported environment as stale.
+        """
+        fpaths = [self.script_file]
+        fpaths.extend(self.script_searchpath)
+        probe_paths = []
+
+        def add_common_probe_paths(root):
+            probe_paths.extend((root / dirname for varname, dirname in ENV_ROOT_DIRS))
+            probe_paths.append(root / 'plugins')
+            probe_paths.extend((root / 'plugins' / dirname for varname, dirname in ENV_PLUGIN_DIRS))
+        # --- end of add_common_probe_paths (...) ---
+
+        for root in filter(None, [self.skel_prjroot, self.ansible_prjroot]):
+            add_common_probe_paths(root)
+            probe_paths.append(root / 'local')
+            probe_paths.append(root / 'local' / 'vault_pass')
+        # --
 
-    config.script_file = pathlib.Path(os.path.realpath(config.script_called))
-    config.script_dir = config.script_file.parent
+        if self.ansible_prjroot:
+            custom_collections_dir = self.ansible_prjroot / 'dust'
+            probe_paths.append(custom_collections_dir)
 
-    # get ansible-skel project root
-    config.skel_prjroot = config.script_dir.parent
-    if not (config.skel_prjroot / '.ansible_skel').exists():
-        sys.stderr.write(
-            f'Failed to detect ansible skel root directory: {config.skel_prjroot}?\n'
-        )
-        return 254
-    # --
+            if custom_collections_dir.is_dir():
+                fpaths.append(custom_collections_dir)
 
-    # get helper files root below ansible-skel project root
-    config.skel_sharedir = config.skel_prjroot / 'share'
-    if not config.skel_sharedir.is_dir():
-        config.skel_sharedir = None
-    # --
+                for ent in sorted(custom_collections_dir.iterdir()):
+                    probe_paths.append(ent)
+                    add_common_probe_paths(ent)
+            # --
+        # --
 
-    # get ansible project root from where we were called
-    # (if not equal to ansible-skel project root)
-    config.ansible_prjroot = config.script_called_dir.parent
-    if config.skel_prjroot.samefile(config.ansible_prjroot):
-        config.ansible_prjroot = None
+        # default inventory
+        inventory_root = self.inventory_root
+        fpaths.append(inventory_root / 'default')
+        probe_paths.append(inventory_root / 'default')
 
-    else:
-        if not (config.ansible_prjroot / 'roles').is_dir():
-            sys.stderr.write(
-                f'Failed to detect ansible roles root directory: {config.ansible_prjroot}? (no roles/ subdir)\n'
-            )
-            return 253
-        # --
-    # --
+        default_inventory = self.find_default_inventory()
+        if default_inventory is not None:
+            fpaths.append(default_inventory)
 
-    # construct search path for scripts and aux files
-    config.script_searchpath = [
-        search_dir for search_dir in (
-            (d / 'libexec')
-            for d in filter(None, [config.ansible_prjroot, config.skel_sharedir])
-        )
-        if search_dir.is_dir()
-    ]
+            for filename in ['hosts', 'hosts.yml', 'hosts.ini']:
+                probe_paths.append(default_inventory.parent / filename)
+        # --
 
-    # get the requested wrapped script
-    wrapped_name = config.script_called.stem
+        # profile files
+        fpaths.extend(RunProfile.get_profile_files(self, default_inventory))
 
-    if wrapped_name == 'wrapper':
-        if not argv:
-            sys.stderr.write('Cannot infer wrapped script name!\n')
-            return 252
+        return (fpaths, probe_paths)
+    # --- end of get_env_export_check_paths (...) ---
 
-        else:
-            wrapped_name = argv[0]
-            argv = argv[1:]
+# --- end of RunConfig ---
 
-            if wrapped_name and wrapped_name[0] == '-':
-                if wrapped_name in {'-h', '--help'}:
-                    return main_show_help(config.script_called.name)
 
-                elif wrapped_name in {'-l', '--list'}:
-                    return main_list_scripts(config)
+class EnvCache(object):
+    """Cached wrapper environment,
+    stored in <project root>/local/tmp/wrapper-env-cache.json.
 
-                elif wrapped_name in {'-i', '--install'}:
-                    return main_install_scripts(config, argv, uninstall=False)
+    The cache is keyed by the mtimes of the directories scanned
+    while building the environment (see RunConfig.get_env_fingerprint_paths())
+    and by the values of all base environment variables
+    that the environment builder has read or modified.
 
-                elif wrapped_name in {'-u', '--uninstall'}:
-                    return main_install_scripts(config, argv, uninstall=True)
+    Set AENV_ENV_CACHE=0 to disable the cache.
+    """
 
-                elif wrapped_name in {'-r', '--reinstall'}:
-                    exit_code = main_install_scripts(config, argv, uninstall=True)
-                    if exit_code is True:
-                        exit_code = main_install_scripts(config, argv, uninstall=False)
+    CACHE_VERSION = 1
 
-                    return exit_code
+    def __init__(self, cache_file):
+        super().__init__()
+        self.cache_file = cache_file
+        self.data       = None
+        self.dirty      = False
+    # --- end of __init__ (...) ---
 
-                else:
-                    sys.stderr.write(f'Unknown wrapper command: {wrapped_name}\n')
-                    return 252
-            # --
+    @classmethod
+    def new_from_config(cls, config, base_env):
+        if base_env.get('AENV_ENV_CACHE', '1') in {'0', 'no', 'false', 'off'}:
+            return None
         # --
-    # --
 
-    (
-        wrapped_path_lookup,
-        wrapped_wants_inventory,
-        wrapped_script
-    ) = config.find_script(wrapped_name)
+        local_dir = config.get_fspath('local')
+        if not local_dir.is_dir():
+            return None
 
-    if not wrapped_script:
-        sys.stderr.write(f'Failed to locate script: {wrapped_name}\n')
-        return 251
-    # --
+        return cls(local_dir / 'tmp' / 'wrapper-env-cache.json')
+    # --- end of new_from_config (...) ---
 
-    # initialize environment
-    env_builder = EnvBuilder(os.environ)
+    @staticmethod
+    def get_stat_fingerprint(fpaths):
+        fingerprint = []
 
-    # drop some shell vars
-    env_builder.discard('_')
-    env_builder.discard('OLDPWD')
+        for fpath in fpaths:
+            try:
+                mtime = os.stat(fpath).st_mtime_ns
+            except OSError:
+                mtime = None
 
-    env_builder['AENV_ROOT'] = config.get_fspath()
-    env_builder['AENV_SKEL_PRJROOT'] = config.skel_prjroot
-    env_builder['AENV_SKEL_SHAREDIR'] = config.skel_sharedir
-    env_builder['AENV_ANSIBLE_PRJROOT'] = config.ansible_prjroot
+            fingerprint.append([str(fpath), mtime])
+        # --
 
-    env_builder.pathlike_push('PATH', config.script_searchpath)
+        return fingerprint
+    # --- end of get_stat_fingerprint (...) ---
 
-    # scan <skel>
-    main_init_env_ansible_prjroot(env_builder, config.skel_prjroot)
+    @staticmethod
+    def get_env_digest(base_env, env_keys):
+        return hashlib.sha1(
+            json.dumps([(k, base_env.get(k)) for k in env_keys]).encode('utf-8')
+        ).hexdigest()
+    # --- end of get_env_digest (...) ---
 
-    if config.ansible_prjroot:
-        # scan <prjroot>/dust/*
-        custom_collections_dir = config.ansible_prjroot / 'dust'
+    def load(self, base_env):
+        """Loads the cache file and returns True if it is still valid."""
+        self.data = None
 
-        if custom_collections_dir.is_dir():
-            for ent in custom_collections_dir.iterdir():
-                if ent.is_dir():
-                    main_init_env_ansible_common(env_builder, ent)
+        try:
+            with open(self.cache_file, 'rt') as fh:
+                data = json.load(fh)
+
+        except (OSError, ValueError):
+            return False
         # --
 
-        # scan <prjroot>
-        main_init_env_ansible_skel(env_builder, config.ansible_prjroot)
-    # --
+        try:
+            if data['version'] != self.CACHE_VERSION:
+                return False
 
-    env  = env_builder.build_env()
-    cmdv = [wrapped_script]
+            elif data['env_digest'] != self.get_env_digest(base_env, data['env_keys']):
+                return False
 
-    if wrapped_wants_inventory:
-        # quick check whether another inventory option was given on the cmdline
-        #  NOTE: option bundling is not implemented
-        #        and argv is not parsed properly
-        #        (--inventory could be an option or an argument/option value)
-        has_inventory_opt = False
-        for arg in argv:
-            if arg.split('=', 1)[0] in {'-i', '--inventory', '--inventory-file'}:
-                has_inventory_opt = True
-                break  # BREAK-LOOP argv
-        # --
+            elif data['fingerprint'] != self.get_stat_fingerprint(
+                [fpath for fpath, mtime in data['fingerprint']]
+            ):
+                return False
 
-        if not has_inventory_opt:
-            inventory_file = config.find_default_inventory()
-            if inventory_file:
-                cmdv.extend(['-i', str(inventory_file)])
+        except (KeyError, TypeError, ValueError):
+            return False
         # --
-    # --
 
-    cmdv.extend(argv)
+        self.data = data
+        return True
+    # --- end of load (...) ---
 
-    if wrapped_path_lookup:
-        # could also be a code builtin
-        if wrapped_script == 'env-diff':
-            return main_dump_env(env_builder.extra_env)
+    def init_data(self, config, env_builder, base_env):
+        env_builder.commit()
 
-        elif wrapped_script == 'env':
-            return main_dump_env(env)
+        extra_env = {
+            k: (None if v is None else str(v))
+            for k, v in env_builder.extra_env.items()
+        }
+
+        env_keys = sorted(set(extra_env) | {'ANSIBLE_VAULT_PASSWORD_FILE'})
+
+        default_inventory = config.find_default_inventory()
+
+        self.data = {
+            'version'           : self.CACHE_VERSION,
+            'fingerprint'       : self.get_stat_fingerprint(config.get_env_fingerprint_paths()),
+            'env_keys'          : env_keys,
+            'env_digest'        : self.get_env_digest(base_env, env_keys),
+            'extra_env'         : extra_env,
+            'default_inventory' : (None if default_inventory is None else str(default_inventory)),
+            'scripts'           : {},
+        }
+        self.dirty = True
+    # --- end of init_data (...) ---
+
+    def get_env_builder(self, base_env):
+        env_builder = EnvBuilder(base_env)
+        env_builder.extra_env.update(self.data['extra_env'])
+        return env_builder
+    # --- end of get_env_builder (...) ---
+
+    def get_default_inventory(self):
+        default_inventory = self.data['default_inventory']
+        return (None if default_inventory is None else pathlib.Path(default_inventory))
+    # --- end of get_default_inventory (...) ---
+
+    def find_script(self, config, wrapped_name):
+        try:
+            path_lookup, wants_inventory, script = self.data['scripts'][wrapped_name]
+
+        except KeyError:
+            path_lookup, wants_inventory, script = config.find_script(wrapped_name)
+
+            if script:
+                self.data['scripts'][wrapped_name] = [
+                    path_lookup, wants_inventory, str(script)
+                ]
+                self.dirty = True
 
         else:
-            os.execvpe(cmdv[0], cmdv, env)
+            if not path_lookup:
+                script = pathlib.Path(script)
+        # --
 
-    else:
-        os.execve(cmdv[0], cmdv, env)
-# --- end of main (...) ---
+        return (path_lookup, wants_inventory, script)
+    # --- end of find_script (...) ---
 
+    def save(self):
+        if not self.dirty:
+            return True
 
-def main_show_help(prog, *, fh=None):
-    if fh is None:
-        fh = sys.stdout
+        tmp_file = self.cache_file.parent / f'.{self.cache_file.name}.{os.getpid()}'
 
-    fh.write(
-        (
-            'Usage:\n'
-            '  {prog} [-h|-l]\n'
-            '  {prog} [-i|-u|-r] [DESTDIR]\n'
-            '  {prog} COMMAND [ARG...]\n'
-            '\n'
-            'Options:\n'
-            '  -h, --help           show this message and exit\n'
-            '  -l, --list           list wrapper commands\n'
-            '  -i, --install        add wrapper links to DESTDIR\n'
-            '  -u, --uninstall      remove wrapper links from DESTDIR\n'
-            '  -r, --reinstall      remove wrapper links from DESTDIR and then readd them\n'
-            '\n'
-            'DESTDIR defaults to the Ansible project root if the wrapper is run from there.\n'
-        ).format(prog=prog)
-    )
-# --- end of main_show_help (...) ---
+        try:
+            os.makedirs(self.cache_file.parent, exist_ok=True)
 
+            with open(tmp_file, 'wt') as fh:
+                json.dump(self.data, fh)
 
-def main_dump_env(env):
-    for varname, value in sorted(env.items(), key=lambda kv: kv[0]):
-        if value is not None:
-            # str(value) may be necessary when processing
-            # intermediate env data (e.g. env_builder.extra_env)
-            sys.stdout.write(
-                '{}={}\n'.format(varname, shlex.quote(str(value)))
-            )
-    # --
+            os.replace(tmp_file, self.cache_file)
 
-    return True
-# --- end of main_dump_env (...) ---
+        except OSError:
+            # cache is optional
+            try:
+                os.unlink(tmp_file)
+            except OSError:
+                pass
 
+            return False
+        # --
 
-def main_list_scripts(config):
-    scripts_map = config.get_scripts_map(add_noinstall=True)
+        self.dirty = False
+        return True
+    # --- end of save (...) ---
+
+# --- end of EnvCache ---
+
+
+class RunProfile(object):
+    """Declarative Ansible performance settings,
+    read from <project root>/aenv_profile.ini
+    and (optionally) <inventory dir>/aenv_profile.ini,
+    where the inventory file overrides the project file:
+
+      [profile]
+      preset              = many-small-hosts
+      forks               = 50
+      pipelining          = yes
+      ssh_control_persist = 60s
+      fact_cache          = yes
+      fact_cache_timeout  = 3600
+      gathering           = smart
+      strategy            = free
+      compiled_inventory  = no
+
+    All settings are optional, presets provide defaults.
+    compiled_inventory enables the inventory snapshot (see CompiledInventory).
+    The resulting env vars never override variables
+    already set in the base environment.
+    """
+
+    PROFILE_FILENAME = 'aenv_profile.ini'
+
+    PRESETS = {
+        # many hosts, short tasks: parallelize, reuse SSH connections briefly
+        'many-small-hosts': {
+            'forks'                 : '50',
+            'pipelining'            : 'yes',
+            'ssh_control_persist'   : '60s',
+            'fact_cache'            : 'yes',
+            'fact_cache_timeout'    : '3600',
+            'gathering'             : 'smart',
+            'strategy'              : 'free',
+        },
+
+        # few hosts, long-running plays: keep connections and facts around
+        'few-big-hosts': {
+            'forks'                 : '5',
+            'pipelining'            : 'yes',
+            'ssh_control_persist'   : '30m',
+            'fact_cache'            : 'yes',
+            'fact_cache_timeout'    : '86400',
+            'gathering'             : 'smart',
+            'strategy'              : 'linear',
+        },
+    }
 
-    if scripts_map:
-        sys.stderr.write('\n'.join(sorted(scripts_map)) + '\n')
+    def __init__(self):
+        super().__init__()
+        self.settings   = {}
+        self.files      = []
+    # --- end of __init__ (...) ---
 
-    return True
-# --- end of main_list_scripts (...) ---
+    @classmethod
+    def get_profile_files(cls, config, inventory_file):
+        profile_files = [config.get_fspath(cls.PROFILE_FILENAME)]
 
+        if inventory_file is not None:
+            inventory_dir = (
+                inventory_file if os.path.isdir(inventory_file)
+                else os.path.dirname(os.path.abspath(inventory_file))
+            )
+            profile_files.append(pathlib.Path(inventory_dir) / cls.PROFILE_FILENAME)
+        # --
 
-def main_install_scripts(config, argv, *, uninstall=False):
-    if argv:
-        dest_dir = pathlib.Path(argv[0])
+        return profile_files
+    # --- end of get_profile_files (...) ---
 
-    elif config.ansible_prjroot:
-        dest_dir = config.ansible_prjroot / 'bin'
+    @classmethod
+    def new_from_config(cls, config, inventory_file):
+        """Returns a profile object if any profile file exists, else None."""
+        profile_files = [
+            fpath for fpath in cls.get_profile_files(config, inventory_file)
+            if fpath.is_file()
+        ]
 
-    else:
-        sys.stderr.write('Missing <destdir> argument (or ansible prjroot)\n')
-        return 2
-    # --
+        if not profile_files:
+            return None
 
-    scripts_map = config.get_scripts_map(add_noinstall=False)
+        profile = cls()
+        for fpath in profile_files:
+            profile.read_file(fpath)
 
-    if uninstall:
-        for script_name in sorted(scripts_map):
-            script_link = dest_dir / script_name
+        return profile
+    # --- end of new_from_config (...) ---
 
-            try:
-                # NOT checking whether script_link is a symlink
-                os.unlink(script_link)
+    def read_file(self, fpath):
+        # only imported when a profile file exists
+        import configparser
 
-            except FileNotFoundError:
-                pass
+        parser = configparser.ConfigParser(interpolation=None)
 
-            else:
-                sys.stdout.write(f'Removed: {script_link}\n')
+        with open(fpath, 'rt') as fh:
+            parser.read_file(fh)
+
+        if parser.has_section('profile'):
+            section = dict(parser.items('profile'))
+
+            # a preset in a later file replaces the settings collected so far
+            preset_name = section.pop('preset', None)
+            if preset_name:
+                try:
+                    preset = self.PRESETS[preset_name]
+                except KeyError:
+                    raise ValueError(f'{fpath}: unknown profile preset: {preset_name}') from None
+
+                self.settings = dict(preset)
+            # --
+
+            self.settings.update(section)
         # --
 
-    else:
-        link_target = os.path.relpath(config.script_file, dest_dir)
+        self.files.append(fpath)
+    # --- end of read_file (...) ---
 
-        os.makedirs(dest_dir, exist_ok=True)
+    @staticmethod
+    def parse_bool(value):
+        value_norm = value.strip().lower()
 
-        for script_name in sorted(scripts_map):
-            script_link = dest_dir / script_name
+        if value_norm in {'1', 'yes', 'y', 'true', 'on'}:
+            return True
 
-            try:
-                os.symlink(link_target, (dest_dir / script_name))
+        elif value_norm in {'0', 'no', 'n', 'false', 'off', ''}:
+            return False
 
-            except FileExistsError:
-                # accept that, regardless of file type
-                pass
+        else:
+            raise ValueError(f'invalid boolean value in profile: {value!r}')
+    # --- end of parse_bool (...) ---
+
+    def iter_env(self, local_dir, inventory_name):
+        """Generates (varname, value) pairs for the Ansible config env vars.
+
+        Settings that need a work directory (SSH ControlPath, fact cache)
+        are skipped if local_dir is None.
+        """
+        settings = self.settings
+
+        if settings.get('forks'):
+            yield ('ANSIBLE_FORKS', str(int(settings['forks'])))
+
+        if settings.get('pipelining'):
+            yield ('ANSIBLE_PIPELINING', str(self.parse_bool(settings['pipelining'])))
+
+        # ControlPersist accepts a boolean or a timeout ("60s", "30m")
+        control_persist = settings.get('ssh_control_persist', '').strip()
+        if control_persist and local_dir is not None:
+            if control_persist.lower() in {'0', 'no', 'n', 'false', 'off'}:
+                yield ('ANSIBLE_SSH_ARGS', '-C -o ControlMaster=no')
 
             else:
-                sys.stdout.write(f'Added: {script_link}\n')
+                if control_persist.lower() in {'1', 'yes', 'y', 'true', 'on'}:
+                    control_persist = 'yes'
+
+                yield (
+                    'ANSIBLE_SSH_ARGS',
+                    f'-C -o ControlMaster=auto -o ControlPersist={control_persist}'
+                )
+                yield ('ANSIBLE_SSH_CONTROL_PATH_DIR', str(local_dir / 'tmp' / 'cp'))
         # --
-    # --
 
-    return True
-# --- end of main_install_scripts (...) ---
+        fact_cache = settings.get('fact_cache')
+        if fact_cache and local_dir is not None and self.parse_bool(fact_cache):
+            yield ('ANSIBLE_CACHE_PLUGIN', 'jsonfile')
+            # separate fact caches per inventory
+            yield ('ANSIBLE_CACHE_PLUGIN_CONNECTION', str(local_dir / 'facts' / inventory_name))
 
+            if settings.get('fact_cache_timeout'):
+                yield (
+                    'ANSIBLE_CACHE_PLUGIN_TIMEOUT', str(int(settings['fact_cache_timeout']))
+                )
+        # --
 
-def main_init_env_ansible_common(env, root):
-    for varname, dirname in [
-        ('AENV_FILES_PATH',             'files'),
-        # ANSIBLE_COLLECTIONS_PATH -- new name in Ansible 2.10,
-        # old name can still be used:
-        ('ANSIBLE_COLLECTIONS_PATHS',   'collections'),
-        ('ANSIBLE_ROLES_PATH',          'roles'),
-        ('PYTHONPATH',                  'pym'),
-    ]:
-        dirpath = root / dirname
+        if settings.get('gathering'):
+            yield ('ANSIBLE_GATHERING', settings['gathering'])
 
-        if dirpath.is_dir():
-            env.pathlike_push(varname, dirpath)
-    # --
+        if settings.get('strategy'):
+            yield ('ANSIBLE_STRATEGY', settings['strategy'])
+    # --- end of iter_env (...) ---
 
-    # append root directory as low-prio
-    #  (NOTE: reversed order - FIXME MAYBE)
-    env.pathlike_append('ANSIBLE_ROLES_PATH', root)
+    def apply(self, env_builder, local_dir, inventory_name):
+        for varname, value in self.iter_env(local_dir, inventory_name):
+            if varname not in env_builder:
+                env_builder[varname] = value
+        # --
+    # --- end of apply (...) ---
 
-    plugins_dir = root / 'plugins'
-    if plugins_dir.is_dir():
-        for varname, dirname in [
-            ('ANSIBLE_DOC_FRAGMENT_PLUGINS',    'doc_fragment'),
-            ('ANSIBLE_ACTION_PLUGINS',          'action'),
-            ('ANSIBLE_BECOME_PLUGINS',          'become'),
-            ('ANSIBLE_CACHE_PLUGINS',           'cache'),
-            ('ANSIBLE_CALLBACK_PLUGINS',        'callback'),
-            ('ANSIBLE_CLICONF_PLUGINS',         'cliconf'),
-            ('ANSIBLE_CONNECTION_PLUGINS',      'connection'),
-            ('ANSIBLE_FILTER_PLUGINS',          'filter'),
-            ('ANSIBLE_HTTPAPI_PLUGINS',         'httpapi'),
-            ('ANSIBLE_INVENTORY_PLUGINS',       'inventory'),
-            ('ANSIBLE_LIBRARY',                 'modules'),
-            ('ANSIBLE_LOOKUP_PLUGINS',          'lookup'),
-            ('ANSIBLE_MODULE_UTILS',            'module_utils'),
-            ('ANSIBLE_NETCONF_PLUGINS',         'netconf'),
-            ('ANSIBLE_STRATEGY_PLUGINS',        'strategy'),
-            ('ANSIBLE_TERMINAL_PLUGINS',        'terminal'),
-            ('ANSIBLE_TEST_PLUGINS',            'test'),
-            ('ANSIBLE_VARS_PLUGINS',            'vars'),
-        ]:
+# --- end of RunProfile ---
+
+
+class CompiledInventory(object):
+    """JSON snapshot of an inventory's host/group structure
+    (ansible-inventory --list --export, with vars plugins disabled),
+    served by the aenv_compiled inventory plugin (plugins/inventory).
+
+    Snapshots are stored in <project root>/local/tmp/inventory-cache/<name>/
+    and get rebuilt whenever the stat fingerprint (path, size, mtime)
+    of any inventory source file or the ANSIBLE_* environment changes.
+
+    The snapshot only contains hosts, groups and the vars set by the
+    inventory sources themselves. The inventory's group_vars/host_vars dirs
+    get symlinked next to the snapshot, so that the vars plugins still load
+    them at run time, with unchanged precedence and vault handling
+    (nothing decrypted is written to the cache dir).
+    Changes in these dirs therefore do not invalidate the snapshot.
+
+    The plugin sets inventory_file/inventory_dir to the original inventory
+    (read from the meta file), so that paths derived from inventory_dir
+    (e.g. ctrl_local_root) do not move into the cache dir.
+
+    Inventories with dynamic sources (executable scripts, inventory plugin
+    configs) are not compiled, the snapshot would never be invalidated.
+    """
+
+    FILE_SUFFIX = '.aenv-compiled.json'
+
+    PLUGIN_NAME = 'aenv_compiled'
+
+    # inventory plugin configs (plugin: <name>)
+    DYNAMIC_INVENTORY_RE = re.compile(r'^plugin\s*:', re.MULTILINE)
+
+    # vars dirs, not inventory sources
+    VARS_DIR_NAMES = {'group_vars', 'host_vars'}
+
+    # ANSIBLE_VARS_ENABLED when compiling: host_group_vars requires being
+    # enabled, so naming no real plugin keeps group_vars/host_vars out
+    # of the snapshot
+    COMPILE_VARS_ENABLED = 'aenv_none'
+
+    # Ansible's default for ANSIBLE_INVENTORY_ENABLED
+    DEFAULT_INVENTORY_ENABLED = ['host_list', 'script', 'auto', 'yaml', 'ini', 'toml']
+
+    # commands that get the compiled inventory instead of the default inventory
+    COMPILED_INVENTORY_WRAPPERS = {
+        'ansible',
+        'ansible-playbook',
+        'ansible-playbook-sharded',
+    }
+
+    def __init__(self, inventory_file, cache_dir):
+        super().__init__()
+        self.inventory_file = pathlib.Path(os.path.abspath(inventory_file))
+        self.inventory_dir  = (
+            self.inventory_file if self.inventory_file.is_dir() else self.inventory_file.parent
+        )
+
+        name = '{name}-{digest}'.format(
+            name    = self.inventory_dir.name,
+            digest  = hashlib.sha1(os.fsencode(self.inventory_file)).hexdigest()[:8],
+        )
+
+        # one dir per inventory, the vars plugins look for
+        # group_vars/host_vars next to the snapshot
+        self.snapshot_dir   = cache_dir / name
+        self.cache_file     = self.snapshot_dir / f'inventory{self.FILE_SUFFIX}'
+        self.meta_file      = self.snapshot_dir / 'inventory.meta.json'
+    # --- end of __init__ (...) ---
+
+    @classmethod
+    def new_from_config(cls, config, inventory_file):
+        local_dir = config.get_fspath('local')
+
+        if inventory_file is None or not local_dir.is_dir():
+            return None
+
+        return cls(inventory_file, local_dir / 'tmp' / 'inventory-cache')
+    # --- end of new_from_config (...) ---
+
+    @staticmethod
+    def is_enabled(base_env, profile):
+        value = base_env.get('AENV_COMPILED_INVENTORY')
+
+        if not value and profile is not None:
+            value = profile.settings.get('compiled_inventory')
+
+        return bool(value) and RunProfile.parse_bool(value)
+    # --- end of is_enabled (...) ---
+
+    @classmethod
+    def apply_env(cls, env_builder):
+        # enable the inventory plugin, regardless of the command being run
+        # (keeps the env identical for the launcher)
+        try:
+            inventory_enabled = env_builder['ANSIBLE_INVENTORY_ENABLED']
+        except KeyError:
+            inventory_enabled = None
+
+        if not inventory_enabled:
+            plugin_names = list(cls.DEFAULT_INVENTORY_ENABLED)
+        else:
+            plugin_names = [w.strip() for w in inventory_enabled.split(',') if w.strip()]
+
+        if cls.PLUGIN_NAME not in plugin_names:
+            env_builder['ANSIBLE_INVENTORY_ENABLED'] = ','.join([cls.PLUGIN_NAME] + plugin_names)
+    # --- end of apply_env (...) ---
+
+    def is_dynamic_source(self, entry, st):
+        # executable files are run by the script inventory plugin
+        if st.st_mode & 0o111:
+            return True
+
+        elif entry.name.endswith(('.yml', '.yaml')):
+            try:
+                with open(entry.path, 'rt', errors='replace') as fh:
+                    return bool(self.DYNAMIC_INVENTORY_RE.search(fh.read(4096)))
+            except OSError:
+                return False
+
+        else:
+            return False
+    # --- end of is_dynamic_source (...) ---
+
+    def get_fingerprint(self, env):
+        """Returns the fingerprint of the inventory,
+        or None if it has dynamic sources (not cacheable)."""
+        fingerprint = hashlib.sha1()
+
+        fingerprint.update(
+            json.dumps(
+                [str(self.inventory_file)]
+                + sorted((k, v) for k, v in env.items() if k.startswith('ANSIBLE_'))
+            ).encode('utf-8')
+        )
+
+        # stat all files below the inventory dir (following symlinks),
+        # dirs are identified by (st_dev, st_ino) to break symlink loops
+        try:
+            st = os.stat(self.inventory_dir)
+        except OSError:
+            return None
+
+        dirs_seen = {(st.st_dev, st.st_ino)}
+        dirs_todo = [(str(self.inventory_dir), False)]
+
+        # a single file inventory is the only source,
+        # a dir inventory has all files outside of the vars dirs
+        inventory_file = (None if self.inventory_file.is_dir() else str(self.inventory_file))
+
+        while dirs_todo:
+            dirpath, in_vars_dir = dirs_todo.pop()
+
+            try:
+                entries = sorted(os.scandir(dirpath), key=lambda e: e.name)
+            except OSError:
+                continue
+
+            for entry in entries:
+                try:
+                    if (
+                        dirpath == str(self.inventory_dir)
+                        and entry.name in self.VARS_DIR_NAMES
+                    ):
+                        # loaded at run time via symlink, only its presence matters
+                        fingerprint.update(
+                            f'{entry.path}\0{entry.is_dir()}\0'.encode(
+                                'utf-8', 'surrogateescape'
+                            )
+                        )
+
+                    elif entry.is_dir():
+                        st = entry.stat()
+                        dir_key = (st.st_dev, st.st_ino)
+
+                        if dir_key not in dirs_seen:
+                            dirs_seen.add(dir_key)
+                            dirs_todo.append(
+                                (entry.path, (in_vars_dir or entry.name in self.VARS_DIR_NAMES))
+                            )
+                        # --
+
+                    else:
+                        st = entry.stat()
+
+                        if (
+                            not in_vars_dir
+                            and (
+                                entry.path == inventory_file
+                                if inventory_file is not None
+                                else not entry.name.startswith('.')
+                            )
+                            and self.is_dynamic_source(entry, st)
+                        ):
+                            return None
+                        # --
+
+                        fingerprint.update(
+                            f'{entry.path}\0{st.st_size}\0{st.st_mtime_ns}\0'.encode(
+                                'utf-8', 'surrogateescape'
+                            )
+                        )
+                    # --
+
+                except OSError:
+                    # broken symlink
+                    fingerprint.update(f'{entry.path}\0-\0'.encode('utf-8', 'surrogateescape'))
+            # --
+        # --
+
+        return fingerprint.hexdigest()
+    # --- end of get_fingerprint (...) ---
+
+    def is_valid(self, fingerprint):
+        try:
+            with open(self.meta_file, 'rt') as fh:
+                meta = json.load(fh)
+
+        except (OSError, ValueError):
+            return False
+
+        return (
+            isinstance(meta, dict)
+            and meta.get('fingerprint') == fingerprint
+            and self.cache_file.is_file()
+        )
+    # --- end of is_valid (...) ---
+
+    def link_vars_dirs(self):
+        """Points the group_vars/host_vars symlinks in the snapshot dir
+        to the inventory's vars dirs, removes links to missing dirs."""
+        for name in sorted(self.VARS_DIR_NAMES):
+            link_file   = self.snapshot_dir / name
+            target      = self.inventory_dir / name
+
+            if target.is_dir():
+                tmp_link = self.snapshot_dir / f'.{name}.{os.getpid()}'
+
+                try:
+                    os.unlink(tmp_link)
+                except FileNotFoundError:
+                    pass
+
+                os.symlink(target, tmp_link)
+                os.replace(tmp_link, link_file)
+
+            else:
+                try:
+                    os.unlink(link_file)
+                except FileNotFoundError:
+                    pass
+            # --
+        # --
+    # --- end of link_vars_dirs (...) ---
+
+    def compile(self, env, fingerprint):
+        # only imported when (re-)compiling
+        import subprocess
+
+        os.makedirs(self.snapshot_dir, mode=0o700, exist_ok=True)
+
+        tmp_file = self.snapshot_dir / f'.{self.cache_file.name}.{os.getpid()}'
+
+        compile_env = dict(env)
+        compile_env['ANSIBLE_VARS_ENABLED'] = self.COMPILE_VARS_ENABLED
+
+        old_umask = os.umask(0o077)
+        try:
+            proc = subprocess.run(
+                [
+                    'ansible-inventory',
+                    '-i', str(self.inventory_file),
+                    '--list', '--export',
+                    '--output', str(tmp_file),
+                ],
+                env     = compile_env,
+                stdin   = subprocess.DEVNULL,
+                stdout  = subprocess.DEVNULL,
+            )
+
+        except OSError as err:
+            sys.stderr.write(f'Failed to compile inventory {self.inventory_file}: {err}\n')
+            return False
+
+        finally:
+            os.umask(old_umask)
+        # --
+
+        if proc.returncode != 0 or not tmp_file.is_file():
+            sys.stderr.write(
+                f'Failed to compile inventory {self.inventory_file} '
+                f'(ansible-inventory exit code {proc.returncode})\n'
+            )
+
+            try:
+                os.unlink(tmp_file)
+            except FileNotFoundError:
+                pass
+
+            return False
+        # --
+
+        try:
+            self.link_vars_dirs()
+        except OSError as err:
+            sys.stderr.write(f'Failed to compile inventory {self.inventory_file}: {err}\n')
+
+            try:
+                os.unlink(tmp_file)
+            except FileNotFoundError:
+                pass
+
+            return False
+        # --
+
+        os.replace(tmp_file, self.cache_file)
+
+        # the meta file marks the snapshot as valid, write it last
+        tmp_meta_file = self.snapshot_dir / f'.{self.meta_file.name}.{os.getpid()}'
+
+        with open(tmp_meta_file, 'wt') as fh:
+            json.dump(
+                {
+                    'fingerprint'       : fingerprint,
+                    'inventory_file'    : str(self.inventory_file),
+                    'inventory_dir'     : str(self.inventory_dir),
+                },
+                fh
+            )
+        # --
+
+        os.replace(tmp_meta_file, self.meta_file)
+
+        return True
+    # --- end of compile (...) ---
+
+    def get(self, env):
+        """Returns the path to an up-to-date snapshot,
+        or None on failure or if the inventory is not cacheable."""
+        fingerprint = self.get_fingerprint(env)
+
+        if fingerprint is None:
+            return None
+
+        elif self.is_valid(fingerprint) or self.compile(env, fingerprint):
+            return self.cache_file
+
+        return None
+    # --- end of get (...) ---
+
+# --- end of CompiledInventory ---
+
+
+class Launcher(object):
+    """Per-project background process that imports the Ansible CLI modules once
+    and forks a child per wrapped command (AENV_LAUNCHER=1).
+
+    The launcher listens on <project root>/local/tmp/launcher.sock.
+    Clients send their argv, cwd, environment and stdio fds;
+    the launcher replies with the child pid and, later, its exit code.
+
+    Ansible reads its configuration when being imported,
+    so each request carries a fingerprint of the import-time settings
+    (ANSIBLE_* vars, PYTHONPATH, HOME and the ansible.cfg that would be used).
+    Requests with a different fingerprint get rejected and the client
+    falls back to exec'ing the command directly,
+    the launcher then stops accepting requests and exits once its
+    running children are done (AENV_LAUNCHER=auto starts a new one).
+
+    The children run in the launcher's session, without a controlling
+    terminal, but with the client's stdio fds (which may be a terminal).
+    With a terminal on stdin, only commands that neither prompt
+    nor start a pager are run via the launcher (TTY_COMMANDS),
+    pause/vars_prompt and pagers need the controlling terminal.
+    Ctrl-C reaches the client, which forwards it to the child.
+    """
+
+    # wrapped command => module providing main(args)
+    CLI_MODULES = {
+        'ansible'               : 'ansible.cli.adhoc',
+        'ansible-config'        : 'ansible.cli.config',
+        'ansible-doc'           : 'ansible.cli.doc',
+        'ansible-galaxy'        : 'ansible.cli.galaxy',
+        'ansible-inventory'     : 'ansible.cli.inventory',
+        'ansible-playbook'      : 'ansible.cli.playbook',
+        'ansible-vault'         : 'ansible.cli.vault',
+    }
+
+    # options that prompt for input, which needs a controlling terminal
+    PROMPT_OPTIONS = {
+        '-k', '--ask-pass',
+        '-K', '--ask-become-pass',
+        '-J', '--ask-vault-pass', '--ask-vault-password',
+    }
+
+    # commands that may be run with a terminal on stdin
+    TTY_COMMANDS = {'ansible', 'ansible-inventory'}
+
+    FORWARD_SIGNALS = ['SIGINT', 'SIGTERM', 'SIGHUP', 'SIGQUIT']
+
+    IDLE_TIMEOUT_DEFAULT = 600
+
+    HEADER_SIZE = 8
+
+    def __init__(self, local_dir):
+        super().__init__()
+        self.local_dir   = local_dir
+        self.socket_file = local_dir / 'tmp' / 'launcher.sock'
+        self.log_file    = local_dir / 'tmp' / 'launcher.log'
+    # --- end of __init__ (...) ---
+
+    @classmethod
+    def new_from_config(cls, config):
+        local_dir = config.get_fspath('local')
+
+        if not local_dir.is_dir():
+            return None
+
+        launcher = cls(local_dir)
+
+        # sun_path is limited to 108 bytes on Linux
+        if len(os.fsencode(launcher.socket_file)) >= 108:
+            return None
+
+        return launcher
+    # --- end of new_from_config (...) ---
+
+    @staticmethod
+    def is_enabled(base_env):
+        return base_env.get('AENV_LAUNCHER', '0') in {'1', 'yes', 'true', 'on', 'auto'}
+    # --- end of is_enabled (...) ---
+
+    @staticmethod
+    def find_ansible_config_file(env, cwd):
+        # mimics ansible.config.manager.find_ini_config_file()
+        candidates = []
+
+        ansible_config = env.get('ANSIBLE_CONFIG')
+        if ansible_config:
+            ansible_config = os.path.expanduser(ansible_config)
+            if os.path.isdir(ansible_config):
+                ansible_config = os.path.join(ansible_config, 'ansible.cfg')
+            candidates.append(ansible_config)
+        # --
+
+        try:
+            # world-writable cwd is ignored by Ansible
+            if not (os.stat(cwd).st_mode & 0o002):
+                candidates.append(os.path.join(cwd, 'ansible.cfg'))
+        except OSError:
+            pass
+
+        if env.get('HOME'):
+            candidates.append(os.path.join(env['HOME'], '.ansible.cfg'))
+
+        candidates.append('/etc/ansible/ansible.cfg')
+
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                return candidate
+        # --
+
+        return None
+    # --- end of find_ansible_config_file (...) ---
+
+    @classmethod
+    def get_fingerprint(cls, env, cwd):
+        config_file = cls.find_ansible_config_file(env, cwd)
+
+        try:
+            config_mtime = (os.stat(config_file).st_mtime_ns if config_file else None)
+        except OSError:
+            config_mtime = None
+
+        return hashlib.sha1(
+            json.dumps([
+                sorted(
+                    (k, v) for k, v in env.items()
+                    if k.startswith('ANSIBLE_') or k in {'PYTHONPATH', 'HOME'}
+                ),
+                config_file,
+                config_mtime,
+            ]).encode('utf-8')
+        ).hexdigest()
+    # --- end of get_fingerprint (...) ---
+
+    @classmethod
+    def accepts(cls, wrapped_name, argv):
+        if wrapped_name not in cls.CLI_MODULES:
+            return False
+
+        elif os.isatty(0) and wrapped_name not in cls.TTY_COMMANDS:
+            # may prompt, needs the controlling terminal
+            return False
+
+        for arg in argv:
+            if arg in cls.PROMPT_OPTIONS or arg.startswith('--ask-'):
+                return False
+        # --
+
+        return True
+    # --- end of accepts (...) ---
+
+    @classmethod
+    def send_msg(cls, sock, data, fds=None):
+        body   = json.dumps(data).encode('utf-8')
+        header = len(body).to_bytes(cls.HEADER_SIZE, 'big')
+
+        if fds:
+            # socket.send_fds() needs Python >= 3.9
+            sent = sock.sendmsg(
+                [header],
+                [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))]
+            )
+            sock.sendall(header[sent:])
+
+        else:
+            sock.sendall(header)
+        # --
+
+        sock.sendall(body)
+    # --- end of send_msg (...) ---
+
+    @classmethod
+    def recv_msg(cls, sock, maxfds=0):
+        def recv_exact(size):
+            buf = b''
+            while len(buf) < size:
+                chunk = sock.recv(size - len(buf))
+                if not chunk:
+                    raise EOFError()
+                buf += chunk
+            # --
+            return buf
+        # ---
+
+        if maxfds:
+            # socket.recv_fds() needs Python >= 3.9
+            fds = array.array('i')
+
+            header, ancdata, flags, addr = sock.recvmsg(
+                cls.HEADER_SIZE, socket.CMSG_LEN(maxfds * fds.itemsize)
+            )
+
+            for cmsg_level, cmsg_type, cmsg_data in ancdata:
+                if cmsg_level == socket.SOL_SOCKET and cmsg_type == socket.SCM_RIGHTS:
+                    fds.frombytes(cmsg_data[:(len(cmsg_data) - (len(cmsg_data) % fds.itemsize))])
+            # --
+
+            fds = list(fds)
+
+            if not header:
+                for fd in fds:
+                    os.close(fd)
+                raise EOFError()
+            # --
+
+            header += recv_exact(cls.HEADER_SIZE - len(header))
+
+        else:
+            fds    = []
+            header = recv_exact(cls.HEADER_SIZE)
+        # --
+
+        data = json.loads(recv_exact(int.from_bytes(header, 'big')).decode('utf-8'))
+        return (data, fds)
+    # --- end of recv_msg (...) ---
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            sock.connect(str(self.socket_file))
+
+        except OSError:
+            sock.close()
+            return None
+
+        return sock
+    # --- end of connect (...) ---
+
+    def request(self, data):
+        # simple request/response (status, stop)
+        sock = self.connect()
+        if sock is None:
+            return None
+
+        with sock:
+            try:
+                self.send_msg(sock, data)
+                return self.recv_msg(sock)[0]
+
+            except (OSError, EOFError, ValueError):
+                return None
+        # --
+    # --- end of request (...) ---
+
+    def run(self, wrapped_name, cmdv, env):
+        """Runs a command in the launcher.
+
+        Returns the exit code, or None if the launcher is not available
+        or rejected the request (caller should exec the command itself).
+        """
+        sock = self.connect()
+        if sock is None:
+            return None
+
+        cwd = os.getcwd()
+
+        with sock:
+            try:
+                self.send_msg(
+                    sock,
+                    {
+                        'cmd'           : 'run',
+                        'name'          : wrapped_name,
+                        'argv'          : [wrapped_name] + [str(arg) for arg in cmdv[1:]],
+                        'cwd'           : cwd,
+                        'env'           : env,
+                        'fingerprint'   : self.get_fingerprint(env, cwd),
+                    },
+                    [0, 1, 2]
+                )
+
+                reply = self.recv_msg(sock)[0]
+
+            except (OSError, EOFError, ValueError):
+                return None
+            # --
+
+            if reply.get('status') != 'started':
+                return None
+
+            child_pid = reply['pid']
+
+            # forward signals to the child's process group
+            def forward_signal(signum, frame):
+                try:
+                    os.killpg(child_pid, signum)
+                except OSError:
+                    pass
+            # ---
+
+            for signame in self.FORWARD_SIGNALS:
+                signal.signal(getattr(signal, signame), forward_signal)
+
+            try:
+                reply = self.recv_msg(sock)[0]
+
+            except (OSError, EOFError, ValueError):
+                # launcher gone, child status unknown
+                return (os.EX_SOFTWARE if hasattr(os, 'EX_SOFTWARE') else 70)
+            # --
+
+            return reply['exit_code']
+        # --
+    # --- end of run (...) ---
+
+    def start(self, env):
+        """Starts the launcher in the background, returns its pid or None."""
+        status = self.request({'cmd': 'status'})
+        if status is not None:
+            return status['pid']
+
+        os.makedirs(self.socket_file.parent, exist_ok=True)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+
+        if pid == 0:
+            # intermediate child: detach and fork the launcher process
+            os.close(read_fd)
+            os.setsid()
+
+            if os.fork() != 0:
+                os._exit(0)
+
+            try:
+                self.serve_daemon(env, write_fd)
+            except BaseException:
+                os._exit(1)
+            else:
+                os._exit(0)
+        # --
+
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+
+        # the launcher writes its pid once it is ready (or nothing on error)
+        with os.fdopen(read_fd, 'rb') as fh:
+            ready_msg = fh.read()
+
+        return (int(ready_msg) if ready_msg else None)
+    # --- end of start (...) ---
+
+    def serve_daemon(self, env, ready_fd):
+        null_fd = os.open(os.devnull, os.O_RDWR)
+        log_fd  = os.open(self.log_file, (os.O_WRONLY | os.O_CREAT | os.O_APPEND), 0o600)
+
+        os.dup2(null_fd, 0)
+        os.dup2(null_fd, 1)
+        os.dup2(log_fd, 2)
+        os.close(null_fd)
+        os.close(log_fd)
+
+        os.environ.clear()
+        os.environ.update(env)
+
+        # import Ansible after setting up the environment
+        cli_modules = {}
+        for wrapped_name, module_name in self.CLI_MODULES.items():
+            try:
+                cli_modules[wrapped_name] = importlib.import_module(module_name)
+            except ImportError as err:
+                sys.stderr.write(f'launcher: cannot import {module_name}: {err}\n')
+        # --
+
+        if not cli_modules:
+            os.close(ready_fd)
+            return
+
+        fingerprint = self.get_fingerprint(os.environ, os.getcwd())
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            os.unlink(self.socket_file)
+        except FileNotFoundError:
+            pass
+
+        old_umask = os.umask(0o077)
+        try:
+            sock.bind(str(self.socket_file))
+        finally:
+            os.umask(old_umask)
+
+        self._sock_ino = os.stat(self.socket_file).st_ino
+
+        sock.listen(16)
+        sock.setblocking(False)
+
+        os.write(ready_fd, str(os.getpid()).encode('ascii'))
+        os.close(ready_fd)
+
+        try:
+            self.serve(sock, cli_modules, fingerprint, env)
+
+        finally:
+            self.close_listener(sock)
+    # --- end of serve_daemon (...) ---
+
+    def close_listener(self, sock):
+        sock.close()
+
+        # a new launcher may already be listening on the socket file
+        try:
+            if os.stat(self.socket_file).st_ino == self._sock_ino:
+                os.unlink(self.socket_file)
+        except FileNotFoundError:
+            pass
+    # --- end of close_listener (...) ---
+
+    @staticmethod
+    def get_exit_code(wait_status):
+        # os.waitstatus_to_exitcode() needs Python >= 3.9,
+        # killed children are reported like the shell does (128 + signal)
+        if os.WIFSIGNALED(wait_status):
+            return (128 + os.WTERMSIG(wait_status))
+        else:
+            return os.WEXITSTATUS(wait_status)
+    # --- end of get_exit_code (...) ---
+
+    def reap_children(self, children):
+        # reports the exit codes of finished children,
+        # returns the number of children reaped
+        num_reaped = 0
+
+        while children:
+            try:
+                pid, wait_status = os.waitpid(-1, (os.WNOHANG | os.WUNTRACED))
+            except ChildProcessError:
+                break
+
+            if pid == 0:
+                break
+
+            elif os.WIFSTOPPED(wait_status):
+                # job control is not available (no controlling terminal),
+                # a stopped child would never continue
+                sys.stderr.write(f'launcher: child {pid} stopped, killing it\n')
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+                continue
+            # --
+
+            num_reaped += 1
+            conn = children.pop(pid, None)
+
+            if conn is not None:
+                try:
+                    self.send_msg(conn, {'exit_code': self.get_exit_code(wait_status)})
+                except OSError:
+                    pass
+                conn.close()
+            # --
+        # --
+
+        return num_reaped
+    # --- end of reap_children (...) ---
+
+    def serve(self, sock, cli_modules, fingerprint, env):
+        def get_package_mtime():
+            try:
+                return os.stat(os.path.dirname(sys.modules['ansible'].__file__)).st_mtime_ns
+            except (KeyError, OSError, TypeError):
+                return None
+        # ---
+
+        try:
+            idle_timeout = int(env.get('AENV_LAUNCHER_IDLE', self.IDLE_TIMEOUT_DEFAULT))
+        except ValueError:
+            idle_timeout = self.IDLE_TIMEOUT_DEFAULT
+
+        package_mtime = get_package_mtime()
+        time_started  = time.time()
+        last_activity = time.monotonic()
+        children      = {}  # pid => client socket
+        listening     = True
+
+        # SIGCHLD wakes up select() via a self-pipe
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_r, False)
+        os.set_blocking(wakeup_w, False)
+
+        signal.signal(signal.SIGCHLD, (lambda signum, frame: None))
+        signal.set_wakeup_fd(wakeup_w)
+
+        def stop_listening():
+            # no new requests, exit once all children are done
+            nonlocal listening
+
+            if listening:
+                listening = False
+                self.close_listener(sock)
+        # --- end of stop_listening (...) ---
+
+        try:
+            while listening or children:
+                if self.reap_children(children):
+                    last_activity = time.monotonic()
+
+                if not listening:
+                    if children:
+                        select.select([wakeup_r], [], [])
+                        self.drain_fd(wakeup_r)
+
+                    continue
+                # --
+
+                if not children and (idle_timeout > 0):
+                    timeout = idle_timeout - (time.monotonic() - last_activity)
+
+                    if timeout <= 0:
+                        break
+
+                else:
+                    timeout = None
+                # --
+
+                readable = select.select([sock, wakeup_r], [], [], timeout)[0]
+
+                if wakeup_r in readable:
+                    self.drain_fd(wakeup_r)
+
+                if sock not in readable:
+                    continue
+
+                try:
+                    conn, addr = sock.accept()
+                except BlockingIOError:
+                    continue
+
+                conn.setblocking(True)
+
+                try:
+                    data, fds = self.recv_msg(conn, maxfds=3)
+
+                except (OSError, EOFError, ValueError):
+                    conn.close()
+                    continue
+                # --
+
+                cmd = data.get('cmd')
+
+                if cmd == 'run':
+                    reason = None
+
+                    if len(fds) != 3:
+                        reason = 'stdio fds missing'
+
+                    elif data['fingerprint'] != fingerprint:
+                        # a new launcher is needed for the changed environment
+                        reason = 'environment changed'
+                        stop_listening()
+
+                    elif data['name'] not in cli_modules:
+                        reason = 'command not supported'
+
+                    elif get_package_mtime() != package_mtime:
+                        reason = 'ansible installation changed'
+                        stop_listening()
+                    # --
+
+                    if reason is not None:
+                        for fd in fds:
+                            os.close(fd)
+
+                        self.send_msg(conn, {'status': 'rejected', 'reason': reason})
+                        conn.close()
+
+                    else:
+                        pid = os.fork()
+
+                        if pid == 0:
+                            signal.set_wakeup_fd(-1)
+                            os.close(wakeup_r)
+                            os.close(wakeup_w)
+                            sock.close()
+                            conn.close()
+                            for child_conn in children.values():
+                                child_conn.close()
+
+                            self.run_child(cli_modules[data['name']], data, fds)
+                            # not reached
+                        # --
+
+                        for fd in fds:
+                            os.close(fd)
+
+                        children[pid] = conn
+                        self.send_msg(conn, {'status': 'started', 'pid': pid})
+                    # --
+
+                else:
+                    for fd in fds:
+                        os.close(fd)
+
+                    if cmd == 'status':
+                        self.send_msg(
+                            conn,
+                            {
+                                'pid'           : os.getpid(),
+                                'uptime'        : (time.time() - time_started),
+                                'fingerprint'   : fingerprint,
+                                'children'      : len(children),
+                                'commands'      : sorted(cli_modules),
+                                'idle_timeout'  : idle_timeout,
+                            }
+                        )
+
+                    elif cmd == 'stop':
+                        self.send_msg(conn, {'pid': os.getpid()})
+                    # --
+
+                    conn.close()
+
+                    if cmd == 'stop':
+                        stop_listening()
+                # --
+            # -- end while
+
+        finally:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+        # --
+    # --- end of serve (...) ---
+
+    @staticmethod
+    def drain_fd(fd):
+        try:
+            while os.read(fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+    # --- end of drain_fd (...) ---
+
+    def run_child(self, cli_module, data, fds):
+        exit_code = 1
+
+        try:
+            # own process group, so that forwarded signals also reach Ansible's workers
+            os.setpgid(0, 0)
+
+            for signame in self.FORWARD_SIGNALS + ['SIGCHLD']:
+                signal.signal(getattr(signal, signame), signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+
+            for target_fd, fd in enumerate(fds):
+                os.dup2(fd, target_fd)
+                os.close(fd)
+            # --
+
+            sys.stdin  = open(0, 'rt', closefd=False)
+            sys.stdout = open(1, 'wt', closefd=False, buffering=(1 if os.isatty(1) else -1))
+            sys.stderr = open(2, 'wt', closefd=False, buffering=1)
+
+            os.environ.clear()
+            os.environ.update(data['env'])
+            os.chdir(data['cwd'])
+
+            sys.argv = list(data['argv'])
+
+            # the Display singleton may have been created in the launcher process
+            # (no tty), recompute its width from the passed stdout like Ansible does
+            display_mod = sys.modules.get('ansible.utils.display')
+            if display_mod is not None:
+                display = display_mod.Display()
+
+                if hasattr(display, 'columns'):
+                    try:
+                        tty_columns = (os.get_terminal_size(1).columns if os.isatty(1) else 0)
+                    except OSError:
+                        tty_columns = 0
+
+                    display.columns = max(79, tty_columns - 1)
+                # --
+            # --
+
+            cli_module.main(sys.argv)
+            exit_code = 0
+
+        except SystemExit as exc:
+            if exc.code is None:
+                exit_code = 0
+            elif isinstance(exc.code, int):
+                exit_code = exc.code
+            else:
+                sys.stderr.write(f'{exc.code}\n')
+                exit_code = 1
+            # --
+
+        except KeyboardInterrupt:
+            exit_code = 130
+
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            exit_code = 1
+
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            except BaseException:
+                pass
+
+            os._exit(exit_code)
+    # --- end of run_child (...) ---
+
+# --- end of Launcher ---
+
+
+def main(prog, argv):
+    tracer = Tracer.new_from_env('wrapper', os.environ)
+
+    try:
+        return main_run(tracer, prog, argv)
+
+    finally:
+        # also closed before exec'ing the wrapped command
+        tracer.close()
+# --- end of main (...) ---
+
+
+def main_run(tracer, prog, argv):
+    with tracer.phase('detect_roots'):
+        config = RunConfig()
+
+        config.script_called = pathlib.Path(__file__)
+        # do not resolve symlinks..
+        config.script_called_dir = pathlib.Path(os.path.abspath(config.script_called.parent))
+
+        config.script_file = pathlib.Path(os.path.realpath(config.script_called))
+        config.script_dir = config.script_file.parent
+
+        # get ansible-skel project root
+        config.skel_prjroot = config.script_dir.parent
+        if not (config.skel_prjroot / '.ansible_skel').exists():
+            sys.stderr.write(
+                f'Failed to detect ansible skel root directory: {config.skel_prjroot}?\n'
+            )
+            return 254
+        # --
+
+        # get helper files root below ansible-skel project root
+        config.skel_sharedir = config.skel_prjroot / 'share'
+        if not config.skel_sharedir.is_dir():
+            config.skel_sharedir = None
+        # --
+
+        # get ansible project root from where we were called
+        # (if not equal to ansible-skel project root)
+        config.ansible_prjroot = config.script_called_dir.parent
+        if config.skel_prjroot.samefile(config.ansible_prjroot):
+            config.ansible_prjroot = None
+
+        else:
+            if not (config.ansible_prjroot / 'roles').is_dir():
+                sys.stderr.write(
+                    f'Failed to detect ansible roles root directory: {config.ansible_prjroot}? (no roles/ subdir)\n'
+                )
+                return 253
+            # --
+        # --
+
+        # construct search path for scripts and aux files
+        config.script_searchpath = [
+            search_dir for search_dir in (
+                (d / 'libexec')
+                for d in filter(None, [config.ansible_prjroot, config.skel_sharedir])
+            )
+            if search_dir.is_dir()
+        ]
+    # --
+
+    # get the requested wrapped script
+    wrapped_name = config.script_called.stem
+
+    if wrapped_name == 'wrapper':
+        if not argv:
+            sys.stderr.write('Cannot infer wrapped script name!\n')
+            return 252
+
+        else:
+            wrapped_name = argv[0]
+            argv = argv[1:]
+
+            if wrapped_name and wrapped_name[0] == '-':
+                if wrapped_name in {'-h', '--help'}:
+                    return main_show_help(config.script_called.name)
+
+                elif wrapped_name in {'-l', '--list'}:
+                    return main_list_scripts(config)
+
+                elif wrapped_name in {'-i', '--install'}:
+                    return main_install_scripts(config, argv, uninstall=False)
+
+                elif wrapped_name in {'-u', '--uninstall'}:
+                    return main_install_scripts(config, argv, uninstall=True)
+
+                elif wrapped_name in {'-E', '--export-env'}:
+                    return main_export_env(config, argv)
+
+                elif wrapped_name in {'-S', '--launcher'}:
+                    return main_launcher(config, argv)
+
+                elif wrapped_name in {'-I', '--repo-init'}:
+                    return main_repo_init(config, argv)
+
+                elif wrapped_name in {'-r', '--reinstall'}:
+                    exit_code = main_install_scripts(config, argv, uninstall=True)
+                    if exit_code is True:
+                        exit_code = main_install_scripts(config, argv, uninstall=False)
+
+                    return exit_code
+
+                else:
+                    sys.stderr.write(f'Unknown wrapper command: {wrapped_name}\n')
+                    return 252
+            # --
+        # --
+    # --
+
+    # initialize environment, from cache if possible
+    #  (env-paths needs the dedup diagnostics, which are not cached)
+    if wrapped_name == 'env-paths':
+        env_cache = None
+    else:
+        env_cache = EnvCache.new_from_config(config, os.environ)
+
+    with tracer.phase('env_cache_load'):
+        env_cache_valid = (env_cache is not None and env_cache.load(os.environ))
+
+    if env_cache_valid:
+        env_builder = env_cache.get_env_builder(os.environ)
+
+    else:
+        with tracer.phase('init_env'):
+            env_builder = main_init_env(config, os.environ)
+            env_builder.commit()
+
+        if wrapped_name != 'env-paths':
+            main_warn_env_paths(env_builder, os.environ)
+
+        if env_cache is not None:
+            env_cache.init_data(config, env_builder, os.environ)
+    # --
+
+    with tracer.phase('find_script'):
+        if env_cache is not None:
+            (
+                wrapped_path_lookup,
+                wrapped_wants_inventory,
+                wrapped_script
+            ) = env_cache.find_script(config, wrapped_name)
+
+            env_cache.save()
+
+        else:
+            (
+                wrapped_path_lookup,
+                wrapped_wants_inventory,
+                wrapped_script
+            ) = config.find_script(wrapped_name)
+        # --
+    # --
+
+    if not wrapped_script:
+        sys.stderr.write(f'Failed to locate script: {wrapped_name}\n')
+        return 251
+    # --
+
+    cmdv = [wrapped_script]
+
+    # quick check whether another inventory option was given on the cmdline
+    #  NOTE: option bundling is not implemented
+    #        and argv is not parsed properly
+    #        (--inventory could be an option or an argument/option value)
+    inventory_arg = (get_inventory_arg(argv) if wrapped_wants_inventory else None)
+
+    if inventory_arg is None:
+        with tracer.phase('find_default_inventory'):
+            if env_cache is not None:
+                inventory_file = env_cache.get_default_inventory()
+            else:
+                inventory_file = config.find_default_inventory()
+        # --
+
+        add_inventory_opt = bool(wrapped_wants_inventory and inventory_file)
+
+    else:
+        inventory_file    = (inventory_arg or None)
+        add_inventory_opt = False
+    # --
+
+    with tracer.phase('profile'):
+        profile = main_apply_profile(config, env_builder, inventory_file)
+
+    with tracer.phase('build_env'):
+        env = env_builder.build_env()
+
+    if add_inventory_opt:
+        inventory_opt = inventory_file
+
+        if (
+            wrapped_name in CompiledInventory.COMPILED_INVENTORY_WRAPPERS
+            and CompiledInventory.is_enabled(os.environ, profile)
+        ):
+            compiled_inventory = CompiledInventory.new_from_config(config, inventory_file)
+
+            if compiled_inventory is not None:
+                with tracer.phase('compiled_inventory'):
+                    inventory_opt = (compiled_inventory.get(env) or inventory_file)
+        # --
+
+        cmdv.extend(['-i', str(inventory_opt)])
+    # --
+
+    cmdv.extend(argv)
+
+    # final event, t is the total time spent in the wrapper
+    tracer.event(
+        'command',
+        cmdv        = cmdv,
+        env_cached  = env_cache_valid,
+        syscalls    = dict(tracer.counts) if tracer.enabled else None,
+    )
+    tracer.close()
+
+    if wrapped_path_lookup:
+        # could also be a code builtin
+        if wrapped_script == 'env-diff':
+            return main_dump_env(env_builder.extra_env)
+
+        elif wrapped_script == 'env':
+            return main_dump_env(env)
+
+        elif wrapped_script == 'env-paths':
+            return main_dump_env_paths(env_builder, os.environ)
+
+        elif wrapped_script == 'ansible-playbook-sharded':
+            return main_playbook_sharded(config, cmdv[1:], env)
+
+        else:
+            if Launcher.is_enabled(os.environ) and Launcher.accepts(wrapped_name, argv):
+                exit_code = main_launcher_run(config, wrapped_name, cmdv, env)
+                if exit_code is not None:
+                    return exit_code
+            # --
+
+            os.execvpe(cmdv[0], cmdv, env)
+
+    else:
+        os.execve(cmdv[0], cmdv, env)
+# --- end of main_run (...) ---
+
+
+def get_inventory_arg(argv):
+    # returns the value of the last inventory option found in argv,
+    # an empty str if the option has no value, or None if not found
+    inventory_arg = None
+    argv_iter     = iter(argv)
+
+    for arg in argv_iter:
+        opt, sep, value = arg.partition('=')
+
+        if opt in {'-i', '--inventory', '--inventory-file'}:
+            inventory_arg = (value if sep else next(argv_iter, ''))
+    # --
+
+    return inventory_arg
+# --- end of get_inventory_arg (...) ---
+
+
+def main_apply_profile(config, env_builder, inventory_file):
+    profile = RunProfile.new_from_config(config, inventory_file)
+
+    if profile is not None:
+        local_dir = config.get_fspath('local')
+
+        if inventory_file is None:
+            inventory_name = 'default'
+        elif os.path.isdir(inventory_file):
+            inventory_name = os.path.basename(os.path.abspath(inventory_file))
+        else:
+            inventory_name = os.path.basename(os.path.dirname(os.path.abspath(inventory_file)))
+        # --
+
+        profile.apply(
+            env_builder,
+            (local_dir if local_dir.is_dir() else None),
+            inventory_name
+        )
+    # --
+
+    if CompiledInventory.is_enabled(env_builder.base_env, profile):
+        CompiledInventory.apply_env(env_builder)
+
+    return profile
+# --- end of main_apply_profile (...) ---
+
+
+def main_launcher_run(config, wrapped_name, cmdv, env):
+    # returns the exit code or None if the command should be exec'd directly
+    launcher = Launcher.new_from_config(config)
+
+    if launcher is None:
+        return None
+
+    exit_code = launcher.run(wrapped_name, cmdv, env)
+
+    if exit_code is None and os.environ.get('AENV_LAUNCHER') == 'auto':
+        # start a launcher for the next commands,
+        # but only if none is running (it may have rejected the request)
+        if launcher.request({'cmd': 'status'}) is None:
+            launcher.start(env)
+    # --
+
+    return exit_code
+# --- end of main_launcher_run (...) ---
+
+
+def main_launcher(config, argv):
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{config.script_called.name} --launcher',
+        description=(
+            'Controls the per-project launcher process, which imports Ansible once '
+            'and runs ansible commands in forked children '
+            '(used if AENV_LAUNCHER=1, or AENV_LAUNCHER=auto to start it on demand).'
+        ),
+    )
+
+    arg_parser.add_argument(
+        'action', choices=['start', 'stop', 'restart', 'status'],
+        help='launcher action'
+    )
+
+    arg_config = arg_parser.parse_args(argv)
+
+    launcher = Launcher.new_from_config(config)
+    if launcher is None:
+        sys.stderr.write('Launcher needs a <project root>/local directory (with a short path).\n')
+        return False
+    # --
+
+    if arg_config.action in {'stop', 'restart'}:
+        reply = launcher.request({'cmd': 'stop'})
+
+        if reply is not None:
+            sys.stderr.write(f'Launcher stopping (pid {reply["pid"]})\n')
+
+            # wait for the socket to disappear
+            for k in range(100):
+                if not launcher.socket_file.exists():
+                    break
+                time.sleep(0.05)
+            # --
+
+        elif arg_config.action == 'stop':
+            sys.stderr.write('Launcher not running\n')
+        # --
+    # --
+
+    if arg_config.action in {'start', 'restart'}:
+        # environment as used for the default inventory
+        env_builder = main_init_env(config, os.environ)
+        main_apply_profile(config, env_builder, config.find_default_inventory())
+
+        pid = launcher.start(env_builder.build_env())
+
+        if pid is None:
+            sys.stderr.write(f'Failed to start launcher, see {launcher.log_file}\n')
+            return False
+
+        sys.stderr.write(f'Launcher running (pid {pid})\n')
+
+    elif arg_config.action == 'status':
+        status = launcher.request({'cmd': 'status'})
+
+        if status is None:
+            sys.stdout.write('not running\n')
+            return False
+
+        for key, value in sorted(status.items()):
+            sys.stdout.write(f'{key}: {value}\n')
+    # --
+
+    return True
+# --- end of main_launcher (...) ---
+
+
+def get_shard_index(host_name, num_shards):
+    # stable across runs (unlike hash()), so that per-host state
+    # like fact caches stays with the same shard
+    return (
+        int.from_bytes(hashlib.sha1(host_name.encode('utf-8')).digest()[:8], 'big')
+        % num_shards
+    )
+# --- end of get_shard_index (...) ---
+
+
+def merge_playbook_exit_codes(exit_codes):
+    # ansible-playbook: 2 = failed hosts, 4 = unreachable hosts,
+    # anything else non-zero is an error and takes precedence
+    errors = [code for code in exit_codes if code not in {0, 2, 4}]
+
+    if errors:
+        return max(errors)
+
+    elif 2 in exit_codes:
+        return 2
+
+    elif 4 in exit_codes:
+        return 4
+
+    else:
+        return 0
+# --- end of merge_playbook_exit_codes (...) ---
+
+
+def split_playbook_sharded_args(argv):
+    # removes --shards, --force-shards and --limit from argv,
+    # returns (num_shards, force_shards, limit, remaining argv),
+    # raises ValueError for missing/bad option values
+    num_shards   = None
+    force_shards = False
+    limit        = None
+    argv_rem     = []
+    argv_iter    = iter(argv)
+
+    def get_value(opt):
+        try:
+            return next(argv_iter)
+        except StopIteration:
+            raise ValueError(f'{opt} needs a value') from None
+    # --- end of get_value (...) ---
+
+    for arg in argv_iter:
+        opt, sep, value = arg.partition('=')
+
+        if opt == '--shards':
+            value = (value if sep else get_value(opt))
+
+            try:
+                num_shards = int(value)
+            except ValueError:
+                raise ValueError(f'--shards needs a number: {value!r}') from None
+
+        elif arg == '--force-shards':
+            force_shards = True
+
+        elif opt in {'-l', '--limit'}:
+            limit = (value if sep else get_value(opt))
+
+        elif arg.startswith('-l') and len(arg) > 2 and not arg.startswith('--'):
+            limit = arg[2:]
+
+        else:
+            argv_rem.append(arg)
+    # --
+
+    return (num_shards, force_shards, limit, argv_rem)
+# --- end of split_playbook_sharded_args (...) ---
+
+
+def get_playbook_run_once_files(argv):
+    # text search for run_once in the playbook files given in argv
+    # and the playbooks they import (roles and included task files are not searched),
+    # returns the files that contain run_once
+    run_once_re = re.compile(r'^\s*(?:-\s+)?run_once\s*:(?!\s*[\'"]?(?:false|no|0)\b)', re.I | re.M)
+    import_re   = re.compile(r'^\s*-?\s*(?:ansible\.builtin\.)?import_playbook\s*:\s*[\'"]?([^\'"#\s]+)', re.M)
+
+    files_todo  = [arg for arg in argv if arg.endswith(('.yml', '.yaml')) and os.path.isfile(arg)]
+    files_seen  = set()
+    files_found = []
+
+    while files_todo:
+        filepath = os.path.abspath(files_todo.pop(0))
+
+        if filepath in files_seen:
+            continue
+
+        files_seen.add(filepath)
+
+        try:
+            with open(filepath, 'rt', errors='replace') as fh:
+                text = fh.read()
+        except OSError:
+            continue
+
+        if run_once_re.search(text):
+            files_found.append(filepath)
+
+        for import_path in import_re.findall(text):
+            # templated paths can not be resolved
+            if '{{' not in import_path:
+                files_todo.append(os.path.join(os.path.dirname(filepath), import_path))
+    # --
+
+    return files_found
+# --- end of get_playbook_run_once_files (...) ---
+
+
+def get_playbook_hosts(argv, limit, env):
+    # runs ansible-playbook --list-hosts,
+    # returns (hosts in order of appearance, list of per-play host patterns)
+    import subprocess
+
+    cmdv = ['ansible-playbook', '--list-hosts'] + argv
+    if limit:
+        cmdv.extend(['--limit', limit])
+
+    proc = subprocess.run(
+        cmdv,
+        env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+    if proc.returncode != 0:
+        return (None, None)
+
+    hosts      = collections.OrderedDict()
+    patterns   = []
+    in_hosts   = False
+    hosts_re   = re.compile(r'^\s+hosts\s+\(\d+\):\s*$')
+    pattern_re = re.compile(r'^\s+pattern:\s*\[(.*)\]\s*$')
+
+    for line in proc.stdout.splitlines():
+        pattern_match = pattern_re.match(line)
+
+        if pattern_match:
+            in_hosts = False
+            patterns.append(re.findall(r"'([^']*)'", pattern_match.group(1)))
+
+        elif hosts_re.match(line):
+            in_hosts = True
+
+        elif in_hosts:
+            host_name = line.strip()
+
+            if host_name and line[:1].isspace():
+                hosts[host_name] = True
+            else:
+                in_hosts = False
+        # --
+    # --
+
+    return (list(hosts), patterns)
+# --- end of get_playbook_hosts (...) ---
+
+
+def get_playbook_localhost_patterns(patterns):
+    # returns the play host patterns that target the controller
+    # (exclusions like all:!localhost do not count)
+    localhost_names = {'localhost', '127.0.0.1'}
+
+    return [
+        pattern for pattern in patterns
+        if any(
+            word.strip().lstrip('&') in localhost_names
+            for item in pattern for word in re.split(r'[,:]', item)
+        )
+    ]
+# --- end of get_playbook_localhost_patterns (...) ---
+
+
+class PlaybookShardOutput(object):
+    """Output of a single ansible-playbook shard, see main_playbook_sharded().
+
+    Lines are collected per block (a PLAY/TASK/RUNNING HANDLER header
+    and the lines up to the next header) and written as a unit once the
+    block is complete, so that the blocks of different shards do not
+    interleave. Host result lines ("ok: [host]", "fatal: [host]: ...")
+    and the continuation lines that follow them (multi-line msg/diff output)
+    get prefixed with the host, other lines (headers, warnings)
+    with the shard label.
+
+    PLAY RECAP lines are not written, they get added to a shared recap.
+    """
+
+    ANSI_RE   = re.compile(r'\x1b\[[0-9;]*m')
+    HEADER_RE = re.compile(r'^(?:PLAY|TASK|RUNNING HANDLER) \[')
+    HOST_RE   = re.compile(r'^[a-z.]+: \[([^\]]+?)(?: -> [^\]]*)?\]')
+    RECAP_RE  = re.compile(r'^(\S+)\s+:\s+((?:\w+=\d+\s*)+)$')
+
+    def __init__(self, label, proc, recap):
+        super().__init__()
+        self.label    = label
+        self.proc     = proc
+        self.recap    = recap   # host => counter, shared by all shards
+        self.buf      = b''
+        self.in_recap = False
+        self.block    = []
+        self.host     = None
+    # --- end of __init__ (...) ---
+
+    def feed(self, data):
+        lines    = (self.buf + data).split(b'\n')
+        self.buf = lines.pop()
+
+        for line in lines:
+            self.handle_line(line.decode('utf-8', 'replace') + '\n')
+    # --- end of feed (...) ---
+
+    def close(self):
+        if self.buf:
+            self.handle_line(self.buf.decode('utf-8', 'replace') + '\n')
+            self.buf = b''
+        # --
+
+        self.flush_block()
+    # --- end of close (...) ---
+
+    def flush_block(self):
+        if self.block:
+            sys.stdout.write(''.join(self.block))
+            self.block = []
+    # --- end of flush_block (...) ---
+
+    def handle_line(self, line):
+        plain_line = self.ANSI_RE.sub('', line).rstrip()
+
+        if plain_line.startswith('PLAY RECAP'):
+            self.flush_block()
+            self.in_recap = True
+            return
+
+        elif self.in_recap:
+            match = self.RECAP_RE.match(plain_line)
+
+            if match:
+                counter = self.recap.setdefault(match.group(1), collections.Counter())
+                for field in match.group(2).split():
+                    key, value = field.split('=')
+                    counter[key] += int(value)
+
+                return
+
+            elif not plain_line:
+                return
+
+            else:
+                self.in_recap = False
+        # --
+
+        if self.HEADER_RE.match(plain_line):
+            self.flush_block()
+            self.host = None
+
+        else:
+            match = self.HOST_RE.match(plain_line)
+
+            if match:
+                self.host = match.group(1)
+
+            elif plain_line.startswith('included: '):
+                # may list several hosts
+                self.host = None
+        # --
+
+        if not plain_line:
+            self.block.append(line)
+
+        elif self.host is not None:
+            self.block.append(f'[{self.host}] {line}')
+
+        else:
+            self.block.append(self.label + line)
+    # --- end of handle_line (...) ---
+
+# --- end of PlaybookShardOutput ---
+
+
+def main_playbook_sharded_help(prog, *, fh=None):
+    if fh is None:
+        fh = sys.stdout
+
+    fh.write(
+        (
+            'Usage:\n'
+            '  {prog} [--shards N] [--force-shards] [ansible-playbook ARG...]\n'
+            '\n'
+            'Runs ansible-playbook in N processes, each with a stable subset of the hosts\n'
+            '(--limit @<file> per shard). The output of each shard is written per\n'
+            'PLAY/TASK block, so blocks of different shards do not interleave\n'
+            '(a block is written once its task is done on all hosts of the shard).\n'
+            'Host result lines and their continuation lines are prefixed with the host,\n'
+            'other lines with the shard. The PLAY RECAP sections get merged.\n'
+            '\n'
+            'Options:\n'
+            '  --shards N           number of shards (default: AENV_SHARDS or number of CPUs)\n'
+            '  --force-shards       shard even if the playbook has localhost plays\n'
+            '                       or run_once tasks\n'
+            '\n'
+            'Each shard is a separate ansible-playbook run, so per-play semantics\n'
+            'apply per shard:\n'
+            '  - run_once tasks run once per shard\n'
+            '  - plays on localhost run once per shard\n'
+            '  - handlers notified on delegated hosts (delegate_to) run once per shard\n'
+            '  - serial/max_fail_percentage/any_errors_fatal only see the shard\'s hosts\n'
+            '\n'
+            'Playbooks with plays on localhost (from --list-hosts) or run_once\n'
+            '(text search in the playbook files and imported playbooks, not in roles)\n'
+            'are run by a single non-sharded ansible-playbook unless --force-shards is given.\n'
+            'Delegated handlers are not detected.\n'
+        ).format(prog=prog)
+    )
+# --- end of main_playbook_sharded_help (...) ---
+
+
+def main_playbook_sharded(config, argv, env):
+    """Runs ansible-playbook in N processes, each with a stable subset of the hosts.
+
+    Output is written per block and prefixed with the host or shard
+    (see PlaybookShardOutput), the per-shard PLAY RECAP sections
+    are merged into a single recap.
+    """
+    import subprocess
+    import selectors
+
+    if '-h' in argv or '--help' in argv:
+        main_playbook_sharded_help('ansible-playbook-sharded')
+        return 0
+    # --
+
+    try:
+        num_shards, force_shards, limit, argv = split_playbook_sharded_args(argv)
+
+    except ValueError as err:
+        sys.stderr.write(f'ansible-playbook-sharded: {err}\n')
+        return 2
+    # --
+
+    if num_shards is None:
+        try:
+            num_shards = int(env.get('AENV_SHARDS') or os.cpu_count() or 1)
+        except ValueError:
+            num_shards = (os.cpu_count() or 1)
+    # --
+
+    if num_shards < 1:
+        sys.stderr.write('ansible-playbook-sharded: --shards must be >= 1\n')
+        return 2
+    # --
+
+    for arg in argv:
+        if arg in Launcher.PROMPT_OPTIONS or arg.startswith('--ask-'):
+            sys.stderr.write(f'ansible-playbook-sharded: prompting options are not supported: {arg}\n')
+            return 2
+    # --
+
+    hosts, patterns = get_playbook_hosts(argv, limit, env)
+    if hosts is None:
+        sys.stderr.write('ansible-playbook-sharded: failed to get the list of hosts\n')
+        return 1
+
+    elif not hosts:
+        sys.stderr.write('ansible-playbook-sharded: no hosts matched\n')
+        return 0
+    # --
+
+    if num_shards > 1 and not force_shards:
+        # would run once per shard
+        not_shardable = [
+            f'plays on {", ".join(pattern)}'
+            for pattern in get_playbook_localhost_patterns(patterns)
+        ] + [
+            f'run_once in {filepath}' for filepath in get_playbook_run_once_files(argv)
+        ]
+
+        if not_shardable:
+            for reason in not_shardable:
+                sys.stderr.write(f'ansible-playbook-sharded: {reason}\n')
+
+            sys.stderr.write(
+                'ansible-playbook-sharded: running a single ansible-playbook'
+                ' (--force-shards to shard anyway)\n'
+            )
+
+            return subprocess.call(
+                (['ansible-playbook'] + argv + (['--limit', limit] if limit else [])),
+                env=env,
+            )
+        # --
+    # --
+
+    shards = [[] for k in range(num_shards)]
+    for host_name in hosts:
+        shards[get_shard_index(host_name, num_shards)].append(host_name)
+
+    # limit files, removed after the run
+    shard_dir = config.get_fspath('local', 'tmp', 'shards')
+    os.makedirs(shard_dir, exist_ok=True)
+
+    child_env = dict(env)
+    if sys.stdout.isatty() and 'ANSIBLE_FORCE_COLOR' not in child_env:
+        child_env['ANSIBLE_FORCE_COLOR'] = '1'
+
+    recap     = collections.OrderedDict()  # host => counter
+    procs     = {}  # fd => PlaybookShardOutput
+    shards_done = []
+    limit_files = []
+    selector  = selectors.DefaultSelector()
+
+    try:
+        for shard_idx, shard_hosts in enumerate(shards):
+            if not shard_hosts:
+                continue
+
+            limit_file = shard_dir / f'{os.getpid()}-{shard_idx}.limit'
+            with open(limit_file, 'wt') as fh:
+                fh.write(''.join((f'{host_name}\n' for host_name in shard_hosts)))
+            limit_files.append(limit_file)
+
+            proc = subprocess.Popen(
+                (['ansible-playbook'] + argv + ['--limit', f'@{limit_file}']),
+                env=child_env, stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            )
+
+            label = f'[{shard_idx + 1}/{num_shards}] '
+            procs[proc.stdout.fileno()] = PlaybookShardOutput(label, proc, recap)
+            selector.register(proc.stdout, selectors.EVENT_READ)
+        # --
+
+        while procs:
+            for key, mask in selector.select():
+                fd     = key.fd
+                output = procs[fd]
+                data   = os.read(fd, 65536)
+
+                if data:
+                    output.feed(data)
+
+                else:
+                    output.close()
+
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    del procs[fd]
+
+                    output.proc.wait()
+                    shards_done.append(output)
+            # --
+            sys.stdout.flush()
+        # --
+
+    except KeyboardInterrupt:
+        # children got the SIGINT, too (same process group)
+        for output in procs.values():
+            output.proc.wait()
+
+        return 130
+
+    finally:
+        for limit_file in limit_files:
+            try:
+                os.unlink(limit_file)
+            except FileNotFoundError:
+                pass
+    # --
+
+    exit_codes = [output.proc.returncode for output in shards_done]
+
+    if recap:
+        sys.stdout.write('\nPLAY RECAP (%d shards) %s\n' % (len(shards_done), ('*' * 50)))
+
+        width = max(len(host_name) for host_name in recap)
+        for host_name in sorted(recap):
+            sys.stdout.write(
+                '{host:<{width}} : {counts}\n'.format(
+                    host    = host_name,
+                    width   = width,
+                    counts  = '  '.join(f'{k}={v}' for k, v in recap[host_name].items()),
+                )
+            )
+        # --
+    # --
+
+    for output in shards_done:
+        if output.proc.returncode:
+            sys.stdout.write(f'{output.label}exit code {output.proc.returncode}\n')
+
+    return merge_playbook_exit_codes(exit_codes)
+# --- end of main_playbook_sharded (...) ---
+
+
+def main_init_env(config, base_env):
+    env_builder = EnvBuilder(base_env)
+
+    # drop some shell vars
+    env_builder.discard('_')
+    env_builder.discard('OLDPWD')
+
+    env_builder['AENV_ROOT'] = config.get_fspath()
+    env_builder['AENV_SKEL_PRJROOT'] = config.skel_prjroot
+    env_builder['AENV_SKEL_SHAREDIR'] = config.skel_sharedir
+    env_builder['AENV_ANSIBLE_PRJROOT'] = config.ansible_prjroot
+
+    env_builder.pathlike_push('PATH', config.script_searchpath)
+
+    # scan <skel>
+    main_init_env_ansible_prjroot(env_builder, config.skel_prjroot)
+
+    if config.ansible_prjroot:
+        # scan <prjroot>/dust/*
+        custom_collections_dir = config.ansible_prjroot / 'dust'
+
+        if custom_collections_dir.is_dir():
+            for ent in custom_collections_dir.iterdir():
+                if ent.is_dir():
+                    main_init_env_ansible_common(env_builder, ent)
+        # --
+
+        # scan <prjroot>
+        main_init_env_ansible_skel(env_builder, config.ansible_prjroot)
+    # --
+
+    return env_builder
+# --- end of main_init_env (...) ---
+
+
+def main_show_help(prog, *, fh=None):
+    if fh is None:
+        fh = sys.stdout
+
+    fh.write(
+        (
+            'Usage:\n'
+            '  {prog} [-h|-l]\n'
+            '  {prog} [-i|-u|-r] [DESTDIR]\n'
+            '  {prog} COMMAND [ARG...]\n'
+            '\n'
+            'Options:\n'
+            '  -h, --help           show this message and exit\n'
+            '  -l, --list           list wrapper commands\n'
+            '  -i, --install        add wrapper links to DESTDIR\n'
+            '  -u, --uninstall      remove wrapper links from DESTDIR\n'
+            '  -r, --reinstall      remove wrapper links from DESTDIR and then readd them\n'
+            '  -E, --export-env     write the project environment to a sourceable file\n'
+            '                       (see --export-env --help)\n'
+            '  -S, --launcher       start/stop the Ansible launcher process\n'
+            '                       (see --launcher --help)\n'
+            '  -I, --repo-init      create/update Ansible project roots\n'
+            '                       (see --repo-init --help)\n'
+            '\n'
+            'DESTDIR defaults to the Ansible project root if the wrapper is run from there.\n'
+            '\n'
+            'Environment variables:\n'
+            '  AENV_ENV_CACHE=0     do not cache the computed environment\n'
+            '                       in <project root>/local/tmp\n'
+            '  AENV_PATHLIST_WARN=N warn about path lists with more than N entries\n'
+            '                       (default: {pathlist_warn}, 0 disables the warning;\n'
+            '                       see the env-paths command for details)\n'
+            '  AENV_TRACE=1|FILE    write phase timings and syscall counts as JSON lines\n'
+            '                       to stderr or FILE (also used by repo-inventory)\n'
+            '  AENV_LAUNCHER=1      run ansible commands via the launcher process if running\n'
+            '                       (=auto: start it on demand), falls back to exec\n'
+            '                       (also when stdin is a terminal, except for ansible\n'
+            '                       and ansible-inventory)\n'
+            '  AENV_LAUNCHER_IDLE=N launcher idle timeout in seconds (default: {launcher_idle})\n'
+            '  AENV_SHARDS=N        number of ansible-playbook processes started by\n'
+            '                       ansible-playbook-sharded (default: number of CPUs;\n'
+            '                       see ansible-playbook-sharded --help)\n'
+            '  AENV_COMPILED_INVENTORY=1\n'
+            '                       pass a cached JSON snapshot of the default inventory\n'
+            '                       to ansible/ansible-playbook (rebuilt on changes,\n'
+            '                       not used for inventory scripts/plugin configs;\n'
+            '                       group_vars/host_vars are still loaded from the\n'
+            '                       inventory dir)\n'
+            '\n'
+            'Performance settings (forks, pipelining, SSH ControlPersist, fact cache,\n'
+            'strategy) can be set in <project root>/{profile_file}\n'
+            'and <inventory dir>/{profile_file}, presets: {presets}.\n'
+        ).format(
+            prog=prog, pathlist_warn=PATHLIST_WARN_DEFAULT,
+            profile_file=RunProfile.PROFILE_FILENAME,
+            presets=', '.join(sorted(RunProfile.PRESETS)),
+            launcher_idle=Launcher.IDLE_TIMEOUT_DEFAULT,
+        )
+    )
+# --- end of main_show_help (...) ---
+
+
+def main_dump_env(env):
+    for varname, value in sorted(env.items(), key=lambda kv: kv[0]):
+        if value is not None:
+            # str(value) may be necessary when processing
+            # intermediate env data (e.g. env_builder.extra_env)
+            sys.stdout.write(
+                '{}={}\n'.format(varname, shlex.quote(str(value)))
+            )
+    # --
+
+    return True
+# --- end of main_dump_env (...) ---
+
+
+def get_pathlist_warn_len(base_env):
+    try:
+        return int(base_env.get('AENV_PATHLIST_WARN', PATHLIST_WARN_DEFAULT))
+    except ValueError:
+        return PATHLIST_WARN_DEFAULT
+# --- end of get_pathlist_warn_len (...) ---
+
+
+def main_warn_env_paths(env_builder, base_env):
+    # long path lists slow down every lookup done by Ansible (roles, plugins)
+    warn_len = get_pathlist_warn_len(base_env)
+
+    if warn_len > 0:
+        for varname, num_entries in sorted(env_builder.pathlike_len.items()):
+            if num_entries > warn_len:
+                sys.stderr.write(
+                    f'WARNING: {varname} has {num_entries} entries '
+                    f'(more than {warn_len}, see env-paths)\n'
+                )
+        # --
+    # --
+# --- end of main_warn_env_paths (...) ---
+
+
+def main_dump_env_paths(env_builder, base_env):
+    warn_len = get_pathlist_warn_len(base_env)
+
+    for varname in sorted(env_builder.pathlike_len):
+        num_entries = env_builder.pathlike_len[varname]
+        dropped     = env_builder.pathlike_dropped.get(varname, ())
+
+        sys.stdout.write(f'{varname}: {num_entries} entries, {len(dropped)} dropped')
+        if warn_len > 0 and num_entries > warn_len:
+            sys.stdout.write(f' (WARNING: more than {warn_len} entries)')
+        sys.stdout.write('\n')
+
+        for entry in env_builder.extra_env[varname].split(':'):
+            sys.stdout.write(f'  {entry}\n')
+
+        for entry, reason in dropped:
+            sys.stdout.write(f'  - {entry} ({reason})\n')
+    # --
+
+    return True
+# --- end of main_dump_env_paths (...) ---
+
+
+def gen_export_env_sh(config, env_builder, *, export_file=None, fmt='sh'):
+    """Generates a sourceable shell file (or direnv .envrc)
+    containing the project-specific environment.
+
+    If export_file is given, a staleness check gets embedded:
+    the file is considered stale if any file or scanned directory
+    it depends on is newer than the file itself,
+    or if any probed path appeared, disappeared or changed its type
+    (see RunConfig.get_env_export_check_paths()).
+    Stale files print a warning when sourced,
+    or get regenerated if AENV_EXPORT_AUTOREGEN=1
+    (default for direnv, which also watches these paths).
+    """
+    q = shlex.quote
+
+    # shell-internal vars, not project-specific
+    skip_vars = {'_', 'OLDPWD'}
+
+    yield f'# generated by {config.script_called.name} --export-env, do not edit\n'
+    yield '\n'
+
+    if export_file is not None:
+        mtime_paths, probe_paths = config.get_env_export_check_paths()
+
+        fpaths     = ' '.join((q(str(p)) for p in mtime_paths))
+        # "<type>:<path>", type is d (dir), f (file) or - (neither)
+        probes     = ' '.join((
+            q('{t}:{p}'.format(
+                t=('d' if p.is_dir() else ('f' if p.is_file() else '-')), p=p
+            ))
+            for p in probe_paths
+        ))
+        regen_cmdv = ' '.join(map(q, [
+            str(config.script_called), '--export-env',
+            '--format', fmt, '--output', str(export_file)
+        ]))
+
+        if fmt == 'direnv':
+            watch_paths = ' '.join((q(str(p)) for p in probe_paths))
+            yield f'watch_file {fpaths} {watch_paths}\n'
+            yield ': "${AENV_EXPORT_AUTOREGEN:=1}"\n'
+            yield '\n'
+        # --
+
+        yield (
+            '__aenv_export_stale="$( find {fpaths} -maxdepth 0 -newer {f} 2>/dev/null | head -n 1 )"\n'
+            '\n'
+            'if [ -z "${{__aenv_export_stale}}" ]; then\n'
+            '    for __aenv_export_probe in {probes}; do\n'
+            '        __aenv_export_path="${{__aenv_export_probe#?:}}"\n'
+            '\n'
+            '        if [ -d "${{__aenv_export_path}}" ]; then\n'
+            '            __aenv_export_type=d\n'
+            '        elif [ -f "${{__aenv_export_path}}" ]; then\n'
+            '            __aenv_export_type=f\n'
+            '        else\n'
+            '            __aenv_export_type=-\n'
+            '        fi\n'
+            '\n'
+            '        if [ "${{__aenv_export_type}}" != "${{__aenv_export_probe%%:*}}" ]; then\n'
+            '            __aenv_export_stale="${{__aenv_export_path}}"\n'
+            '            break\n'
+            '        fi\n'
+            '    done\n'
+            'fi\n'
+            '\n'
+            'if [ -n "${{__aenv_export_stale}}" ] && [ "${{AENV_EXPORT_AUTOREGEN-}}" = "1" ] && \\\n'
+            '    [ -z "${{__aenv_export_regen-}}" ] && {regen} 1>&2\n'
+            'then\n'
+            '    __aenv_export_regen=1\n'
+            '    . {f}\n'
+            '    unset -v __aenv_export_regen\n'
+            'else\n'
+            '    if [ -n "${{__aenv_export_stale}}" ]; then\n'
+            '        printf \'WARNING: %s is stale (changed: %s), regenerate it with: %s\\n\' \\\n'
+            '            {f} "${{__aenv_export_stale}}" {regen_str} 1>&2\n'
+            '    fi\n'
+            '\n'
+        ).format(
+            fpaths=fpaths, probes=probes, f=q(str(export_file)),
+            regen=regen_cmdv, regen_str=q(regen_cmdv),
+        )
+
+        indent = '    '
+
+    else:
+        indent = ''
+    # --
+
+    for varname, action, value in env_builder.iter_export_env():
+        if varname in skip_vars:
+            pass
+
+        elif action == 'set':
+            yield f'{indent}export {varname}={q(value)}\n'
+
+        elif action == 'unset':
+            yield f'{indent}unset -v {varname}\n'
+
+        elif action == 'pathlike':
+            # prepend/append to the value found in the sourcing shell
+            prefix, suffix = value
+            base_ref_prefixed = '"${%s:+:${%s}}"' % (varname, varname)
+            base_ref_suffixed = '"${%s:+${%s}:}"' % (varname, varname)
+
+            if prefix and suffix:
+                expr = q(':'.join(prefix)) + base_ref_prefixed + q(':' + ':'.join(suffix))
+
+            elif prefix:
+                expr = q(':'.join(prefix)) + base_ref_prefixed
+
+            elif suffix:
+                expr = base_ref_suffixed + q(':'.join(suffix))
+
+            else:
+                expr = None
+            # --
+
+            if expr is not None:
+                yield f'{indent}export {varname}={expr}\n'
+
+        else:
+            raise NotImplementedError(action)
+    # --
+
+    if export_file is not None:
+        yield 'fi\n'
+        yield 'unset -v __aenv_export_stale __aenv_export_probe __aenv_export_path __aenv_export_type\n'
+    # --
+# --- end of gen_export_env_sh (...) ---
+
+
+def main_export_env(config, argv):
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{config.script_called.name} --export-env',
+        description=(
+            'Writes the project-specific environment (PATH, ANSIBLE_*, AENV_*, ...) '
+            'to a sourceable shell file or direnv .envrc, '
+            'so that Ansible commands can be run without the wrapper.'
+        ),
+    )
+
+    arg_parser.add_argument(
+        '-f', '--format', dest='fmt',
+        default='sh', choices=['sh', 'direnv'],
+        help='output format (default: %(default)s)'
+    )
+
+    arg_parser.add_argument(
+        '-o', '--output', dest='output', metavar='<file>',
+        default=None,
+        help=(
+            'output file, "-" for stdout (without staleness check) '
+            '(default: <project root>/local/env.sh or <project root>/.envrc for direnv)'
+        )
+    )
+
+    arg_config = arg_parser.parse_args(argv)
+
+    # build the environment from scratch (no cache),
+    # the export needs to know which parts were added to the base env
+    env_builder = main_init_env(config, os.environ)
+
+    default_inventory = config.find_default_inventory()
+    main_apply_profile(config, env_builder, default_inventory)
+
+    # the wrapper passes the default inventory via -i,
+    # which also takes precedence over ANSIBLE_INVENTORY
+    if default_inventory is not None:
+        env_builder['ANSIBLE_INVENTORY'] = default_inventory
+
+    if arg_config.output == '-':
+        sys.stdout.write(''.join(gen_export_env_sh(config, env_builder, fmt=arg_config.fmt)))
+        return True
+    # --
+
+    if arg_config.output:
+        export_file = pathlib.Path(os.path.abspath(arg_config.output))
+
+    elif arg_config.fmt == 'direnv':
+        export_file = config.get_fspath('.envrc')
+
+    else:
+        export_file = config.get_fspath('local', 'env.sh')
+    # --
+
+    content = ''.join(
+        gen_export_env_sh(config, env_builder, export_file=export_file, fmt=arg_config.fmt)
+    )
+
+    # write after scanning, so that the file is newer than the scanned paths
+    tmp_file = export_file.parent / f'.{export_file.name}.{os.getpid()}'
+
+    os.makedirs(export_file.parent, exist_ok=True)
+
+    with open(tmp_file, 'wt') as fh:
+        fh.write(content)
+
+    os.replace(tmp_file, export_file)
+    # renaming updates the mtime of the parent dir, which may be a scanned path
+    os.utime(export_file)
+
+    sys.stderr.write(f'Written: {export_file}\n')
+    return True
+# --- end of main_export_env (...) ---
+
+
+def repo_init(config, prjroot, *, dry_run=False):
+    """Initializes an Ansible project root (idempotent).
+
+    Generates (changed, description) tuples for each step.
+    """
+    # project root and directories in project root
+    for dirpath in [
+        prjroot,
+        prjroot / 'bin',
+        prjroot / 'includes',
+        prjroot / 'local',
+        prjroot / 'roles',
+    ]:
+        try:
+            mode = (os.stat(dirpath).st_mode & 0o7777)
+
+        except FileNotFoundError:
+            if not dry_run:
+                os.makedirs(dirpath, 0o755)
+                os.chmod(dirpath, 0o755)  # mkdir() is subject to the umask
+
+            yield (True, f'mkdir {dirpath}')
+
+        else:
+            if not os.path.isdir(dirpath):
+                raise NotADirectoryError(dirpath)
+
+            elif mode != 0o755:
+                if not dry_run:
+                    os.chmod(dirpath, 0o755)
+
+                yield (True, f'chmod 0755 {dirpath}')
+
+            else:
+                yield (False, f'directory {dirpath}')
+        # --
+    # --
+
+    # copy over gitignore if missing
+    gitignore_src = config.skel_prjroot / '.gitignore'
+    gitignore_dst = prjroot / '.gitignore'
+
+    if os.path.lexists(gitignore_dst):
+        yield (False, f'file {gitignore_dst}')
+
+    else:
+        if not dry_run:
+            import shutil
+            shutil.copyfile(gitignore_src, gitignore_dst)
+
+        yield (True, f'copy {gitignore_src} {gitignore_dst}')
+    # --
+
+    # install exec wrappers in project root
+    scripts_map = config.get_scripts_map(add_noinstall=False)
+    wrappers_added = list(install_scripts(config, (prjroot / 'bin'), scripts_map, dry_run=dry_run))
+
+    if wrappers_added:
+        yield (True, f'install {len(wrappers_added)} wrappers in {prjroot / "bin"}')
+    else:
+        yield (False, f'wrappers in {prjroot / "bin"}')
+# --- end of repo_init (...) ---
+
+
+def main_repo_init(config, argv):
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{config.script_called.name} --repo-init',
+        description=(
+            'Creates or updates Ansible project roots: '
+            'directories, .gitignore and wrapper links.'
+        ),
+    )
+
+    arg_parser.add_argument(
+        '-n', '--dry-run',
+        dest='dry_run', default=False, action='store_true',
+        help='just show what would be done'
+    )
+
+    arg_parser.add_argument(
+        '-v', '--verbose',
+        dest='verbose', default=False, action='store_true',
+        help='also show unchanged items'
+    )
+
+    arg_parser.add_argument(
+        'dest', nargs='*',
+        help='project root(s) (default: current Ansible project root)'
+    )
+
+    arg_config = arg_parser.parse_args(argv)
+
+    dest_list = arg_config.dest
+    if not dest_list:
+        default_dest = (os.environ.get('AENV_ANSIBLE_PRJROOT') or config.ansible_prjroot)
+
+        if not default_dest:
+            sys.stderr.write('Missing <dest> arg (and no implicit project root found)\n')
+            return 64
+
+        dest_list = [default_dest]
+    # --
+
+    status_changed = ('would change' if arg_config.dry_run else 'changed')
+    exit_code      = True
+
+    for dest in dest_list:
+        prjroot     = pathlib.Path(os.path.realpath(dest))
+        num_changed = 0
+        num_ok      = 0
+
+        try:
+            for changed, desc in repo_init(config, prjroot, dry_run=arg_config.dry_run):
+                if changed:
+                    num_changed += 1
+                    sys.stdout.write(f'{status_changed}: {desc}\n')
+
+                else:
+                    num_ok += 1
+                    if arg_config.verbose:
+                        sys.stdout.write(f'ok: {desc}\n')
+            # --
+
+        except OSError as err:
+            sys.stderr.write(f'failed: {prjroot}: {err}\n')
+            exit_code = False
+
+        else:
+            sys.stdout.write(f'{prjroot}: ok={num_ok} {status_changed}={num_changed}\n')
+    # --
+
+    return exit_code
+# --- end of main_repo_init (...) ---
+
+
+def main_list_scripts(config):
+    scripts_map = config.get_scripts_map(add_noinstall=True)
+
+    if scripts_map:
+        sys.stderr.write('\n'.join(sorted(scripts_map)) + '\n')
+
+    return True
+# --- end of main_list_scripts (...) ---
+
+
+def install_scripts(config, dest_dir, scripts_map, *, dry_run=False):
+    # generates the wrapper links that were (or would be) added
+    link_target = os.path.relpath(config.script_file, dest_dir)
+
+    if not dry_run:
+        os.makedirs(dest_dir, exist_ok=True)
+
+    for script_name in sorted(scripts_map):
+        script_link = dest_dir / script_name
+
+        if dry_run:
+            if not os.path.lexists(script_link):
+                yield script_link
+
+        else:
+            try:
+                os.symlink(link_target, script_link)
+
+            except FileExistsError:
+                # accept that, regardless of file type
+                pass
+
+            else:
+                yield script_link
+        # --
+    # --
+# --- end of install_scripts (...) ---
+
+
+def main_install_scripts(config, argv, *, uninstall=False):
+    if argv:
+        dest_dir = pathlib.Path(argv[0])
+
+    elif config.ansible_prjroot:
+        dest_dir = config.ansible_prjroot / 'bin'
+
+    else:
+        sys.stderr.write('Missing <destdir> argument (or ansible prjroot)\n')
+        return 2
+    # --
+
+    scripts_map = config.get_scripts_map(add_noinstall=False)
+
+    if uninstall:
+        for script_name in sorted(scripts_map):
+            script_link = dest_dir / script_name
+
+            try:
+                # NOT checking whether script_link is a symlink
+                os.unlink(script_link)
+
+            except FileNotFoundError:
+                pass
+
+            else:
+                sys.stdout.write(f'Removed: {script_link}\n')
+        # --
+
+    else:
+        for script_link in install_scripts(config, dest_dir, scripts_map):
+            sys.stdout.write(f'Added: {script_link}\n')
+    # --
+
+    return True
+# --- end of main_install_scripts (...) ---
+
+
+def main_init_env_ansible_common(env, root):
+    for varname, dirname in ENV_ROOT_DIRS:
+        dirpath = root / dirname
+
+        if dirpath.is_dir():
+            env.pathlike_push(varname, dirpath)
+    # --
+
+    # append root directory as low-prio
+    #  (NOTE: reversed order - FIXME MAYBE)
+    env.pathlike_append('ANSIBLE_ROLES_PATH', root)
+
+    plugins_dir = root / 'plugins'
+    if plugins_dir.is_dir():
+        for varname, dirname in ENV_PLUGIN_DIRS:
             dirpath = plugins_dir / dirname
 
             if dirpath.is_dir():
@@ -14,12 +14,19 @@
 
 # Python >= 3.7 only
 
+import collections.abc
 import functools
+import hashlib
 import operator
 import re
 
 from ansible.module_utils.common.collections import is_sequence
 
+try:
+    from ansible.parsing.yaml.dumper import AnsibleDumper
+except ImportError:
+    AnsibleDumper = None
+
 
 # lazy copy-paste
 def _convert_to_sequence(arg):
@@ -44,107 +51,828 @@ def _identity(obj):
     return obj
 
 
-@functools.lru_cache(maxsize=32)
-def _itemgetter_recursive(full_key):
-    key_path = full_key.split('.')
+# exceptions indicating that a key path segment could not be looked up
+_KEY_PATH_LOOKUP_ERRORS = (KeyError, IndexError, TypeError, AttributeError)
+
+# key path syntax: <name> { "." <name> | "[" <int> "]" }
+_KEY_PATH_RE = re.compile(
+    r'^(?:[^.\[\]]+|\[-?[0-9]+\])(?:[.][^.\[\]]+|\[-?[0-9]+\])*$'
+)
+_KEY_PATH_SEGMENT_RE = re.compile(r'\[(-?[0-9]+)\]|([^.\[\]]+)')
+
+
+def _parse_key_path(key):
+    """Splits a key into a tuple of path segments.
 
-    def wrapper_recursive(obj):
-        attr = obj
+    Dot-separated names are str segments (dict item or attribute),
+    bracketed numbers ('a[0]') are int segments (list index).
+    Non-str keys are returned as single segment.
+    """
+    if not isinstance(key, str):
+        return (key,)
+
+    elif not _KEY_PATH_RE.match(key):
+        raise ValueError('invalid key path', key)
 
-        for key in key_path:
+    else:
+        return tuple((
+            (int(idx) if idx else name)
+            for idx, name in _KEY_PATH_SEGMENT_RE.findall(key)
+        ))
+# --- end of _parse_key_path (...) ---
+
+
+def _key_path_lookup_segment(obj, segment):
+    """Looks up a single key path segment,
+    trying dict items first, then list indices and attributes.
+
+    Attributes are only looked up on objects that are neither
+    mappings nor sequences, so that keys like 'items' or 'count'
+    do not resolve to dict/list methods. Callables are never returned.
+
+    Raises LookupError if the segment could not be found.
+    """
+    try:
+        return obj[segment]
+    except _KEY_PATH_LOOKUP_ERRORS:
+        pass
+
+    if isinstance(segment, str):
+        if not isinstance(obj, (collections.abc.Mapping, collections.abc.Sequence)):
             try:
-                next_attr = getattr(attr, key)
+                value = getattr(obj, segment)
             except AttributeError:
-                return None
+                pass
             else:
-                attr = next_attr
+                if not callable(value):
+                    return value
             # --
-        # -- end for
+        # --
 
-        return attr
-    # --- end of wrapper_recursive (...) ---
+        if segment.lstrip('-').isdigit():
+            try:
+                return obj[int(segment)]
+            except _KEY_PATH_LOOKUP_ERRORS:
+                pass
+        # --
+    # --
+
+    raise LookupError(segment)
+# --- end of _key_path_lookup_segment (...) ---
+
+
+def _compile_key_path_generic(key_path):
+    """Creates a getter function for a key path (any length)
+    that returns None if any segment could not be found."""
+    def getter_generic(obj):
+        for segment in key_path:
+            try:
+                obj = _key_path_lookup_segment(obj, segment)
+            except LookupError:
+                return None
+        # --
+
+        return obj
+    # --- end of getter_generic (...) ---
+
+    return getter_generic
+# --- end of _compile_key_path_generic (...) ---
 
-    if not key_path:
-        return _identity
 
-    elif len(key_path) == 1:
-        return operator.itemgetter(key_path[0])
+def _compile_key_path(key_path):
+    """Creates a getter function for a key path.
+
+    Common shapes (1-3 segments) get a specialized fast path
+    that assumes nested dicts/lists and falls back to
+    the generic lookup on error.
+
+    Single-segment keys raise KeyError if the key could not be found
+    (like operator.itemgetter()), longer paths return None.
+    """
+    getter_generic = _compile_key_path_generic(key_path)
+
+    if len(key_path) == 1:
+        (k0,) = key_path
+
+        def getter(obj):
+            try:
+                return obj[k0]
+            except _KEY_PATH_LOOKUP_ERRORS:
+                pass
+
+            try:
+                return _key_path_lookup_segment(obj, k0)
+            except LookupError:
+                raise KeyError(k0) from None
+        # ---
+
+    elif len(key_path) == 2:
+        (k0, k1) = key_path
+
+        def getter(obj):
+            try:
+                return obj[k0][k1]
+            except _KEY_PATH_LOOKUP_ERRORS:
+                return getter_generic(obj)
+        # ---
+
+    elif len(key_path) == 3:
+        (k0, k1, k2) = key_path
+
+        def getter(obj):
+            try:
+                return obj[k0][k1][k2]
+            except _KEY_PATH_LOOKUP_ERRORS:
+                return getter_generic(obj)
+        # ---
 
     else:
-        return wrapper_recursive
-# --- end of _itemgetter_recursive (...) ---
+        getter = getter_generic
+    # --
 
+    return getter
+# --- end of _compile_key_path (...) ---
 
-def _get_keyfunc(key):
+
+def _normalize_key_spec(key):
+    """Converts a key spec as accepted by _get_keyfunc() to a hashable object."""
     if (not key) or (key is True):
-        return _identity
+        return None
 
     elif isinstance(key, str):
-        return _itemgetter_recursive(key)
+        return key
 
     elif hasattr(key, '__iter__') or hasattr(key, '__next__'):
-        item_getters = [_itemgetter_recursive(k) for k in key]
-        # function that returns a (usually hashable) tuple of keys
-        return (lambda o, *, _fnv=item_getters: tuple((_fn(o) for _fn in _fnv)))
+        return tuple(key)
 
     else:
-        return _itemgetter_recursive(key)
+        return key
+# --- end of _normalize_key_spec (...) ---
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_keyfunc(key_spec):
+    """Creates a key function for a normalized key spec, see _get_keyfunc()."""
+    if key_spec is None:
+        return _identity
+
+    elif not isinstance(key_spec, tuple):
+        return _compile_key_path(_parse_key_path(key_spec))
+
+    # multi-key: function that returns a (usually hashable) tuple of keys
+    key_paths    = [_parse_key_path(k) for k in key_spec]
+    item_getters = [_compile_key_path(p) for p in key_paths]
+
+    def getter_multi_generic(obj):
+        return tuple((_fn(obj) for _fn in item_getters))
+    # ---
+
+    if not item_getters:
+        return (lambda obj: ())
+
+    elif all((len(p) == 1 for p in key_paths)):
+        # flat keys: let itemgetter() build the tuple,
+        # fall back to per-key lookup on error
+        flat_getter = operator.itemgetter(*[p[0] for p in key_paths])
+
+        if len(key_paths) == 1:
+            # itemgetter() with one arg does not return a tuple
+            def getter(obj):
+                try:
+                    return (flat_getter(obj),)
+                except _KEY_PATH_LOOKUP_ERRORS:
+                    return getter_multi_generic(obj)
+            # ---
+
+        else:
+            def getter(obj):
+                try:
+                    return flat_getter(obj)
+                except _KEY_PATH_LOOKUP_ERRORS:
+                    return getter_multi_generic(obj)
+            # ---
+        # --
+
+        return getter
+
+    elif len(item_getters) == 2:
+        (g0, g1) = item_getters
+        return (lambda obj: (g0(obj), g1(obj)))
+
+    elif len(item_getters) == 3:
+        (g0, g1, g2) = item_getters
+        return (lambda obj: (g0(obj), g1(obj), g2(obj)))
+
+    else:
+        return getter_multi_generic
+# --- end of _compile_keyfunc (...) ---
+
+
+def _get_keyfunc(key):
+    """Returns a key function for the given key spec.
+
+    The key spec may be
+      - None or True: identity (use item as key)
+      - a key path (str), e.g. 'name', 'a.b', 'addr[0].ip':
+        dot-separated names are looked up as dict items,
+        with attributes and list indices as fallback,
+        bracketed numbers are list indices.
+        Missing path segments result in None,
+        except for single-segment keys (e.g. 'name'), which raise KeyError.
+      - a list of key paths, resulting in a tuple of values
+      - any other hashable object, looked up as dict item / list index
+
+    Compiled key functions are kept in a bounded cache,
+    see keypath_cache_info().
+    """
+    return _compile_keyfunc(_normalize_key_spec(key))
 # --- end of _get_keyfunc (...) ---
 
 
-def _aenv_items_diff_calc_key_sets(
-    dict_left, dict_right,
-    keys_ignore=None, keys_regexp_ignore=None
-):
-    """Helper function, see aenv_items_diff()."""
-    # build effective keys set for left / right
-    # start fully loaded
-    keys_left   = set(dict_left)
-    keys_right  = set(dict_right)
-
-    drop_keys_left = set()
-    drop_keys_right = set()
-
-    # mark keys for removal: apply keys_ignore if given
-    if keys_ignore:
-        keys_ignore_set = set(_convert_to_sequence(keys_ignore))
-        drop_keys_left.update(keys_ignore_set)
-        drop_keys_right.update(keys_ignore_set)
+def keypath_cache_info():
+    """Returns hit/miss statistics of the key function cache."""
+    info = _compile_keyfunc.cache_info()
+
+    return {
+        'hits'      : info.hits,
+        'misses'    : info.misses,
+        'maxsize'   : info.maxsize,
+        'currsize'  : info.currsize,
+    }
+# --- end of keypath_cache_info (...) ---
+
+
+class AenvDiffIndex(object):
+    """A prebuilt key => item index of a single collection
+    that may be passed to aenv_items_diff() and friends
+    in place of a raw sequence.
+
+    Indexes are hashable (by identity)
+    and should be treated as read-only.
+    """
+
+    __slots__ = ['key', 'items_map']
+
+    def __init__(self, key, items_map):
+        super().__init__()
+        self.key       = key
+        self.items_map = items_map
+    # --- end of __init__ (...) ---
+
+    @classmethod
+    def new_from_sequence(cls, arg, key=None):
+        key_spec = _normalize_key_spec(key)
+        keyfunc  = _get_keyfunc(key_spec)
+
+        return cls(key_spec, {keyfunc(o): o for o in _iter_sequence(arg)})
+    # --- end of new_from_sequence (...) ---
+
+    def __reduce__(self):
+        # picklable, e.g. when passed to another process as part of a result
+        return (self.__class__, (self.key, self.items_map))
+
+    def __hash__(self):
+        return id(self)
+
+    def __eq__(self, other):
+        return (self is other)
+
+    def __len__(self):
+        return len(self.items_map)
+
+    def __iter__(self):
+        return iter(self.items_map.values())
+
+    def values(self):
+        return self.items_map.values()
+
+    def __repr__(self):
+        return '{cls}(key={key!r}, <{n} items>)'.format(
+            cls=self.__class__.__name__, key=self.key, n=len(self.items_map)
+        )
+    # --- end of __repr__ (...) ---
+
+# --- end of AenvDiffIndex ---
+
+
+def _get_key_dict(arg, keyfunc):
+    """Returns the key => item dict for a collection or a prebuilt index."""
+    if isinstance(arg, AenvDiffIndex):
+        return arg.items_map
+    else:
+        return {keyfunc(o) : o for o in _iter_sequence(arg)}
+# --- end of _get_key_dict (...) ---
+
+
+# regexp metachars -- patterns without them (anchors aside) are literals
+_REGEXP_LITERAL_RE = re.compile(r'^(?:[^.^$*+?{}\[\]\\|()]|\\[^0-9A-Za-z])*$')
+_REGEXP_UNESCAPE_RE = re.compile(r'\\(.)')
+# inline global flags at the start of a pattern, e.g. '(?i)'
+_REGEXP_GLOBAL_FLAGS_RE = re.compile(r'^\(\?([aiLmsux]+)\)')
+# backreferences do not survive merging patterns into one alternation
+_REGEXP_BACKREF_RE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def _regexp_get_literal(expr):
+    """Returns the unescaped literal string if the given regular expression
+    matches a literal string only, else None."""
+    if _REGEXP_LITERAL_RE.match(expr):
+        return _REGEXP_UNESCAPE_RE.sub(r'\1', expr)
+    else:
+        return None
+# --- end of _regexp_get_literal (...) ---
+
+
+class AenvKeyIgnoreMatcher(object):
+    """Precompiled matcher for keys_ignore / keys_regexp_ignore.
+
+    Keys are checked in four steps:
+      - exact match (set lookup) against keys_ignore and '^literal$'
+        expressions, the latter also match 'literal' + newline like '$' does
+      - prefix match against all '^literal' expressions
+        (a single str.startswith() call with a tuple of prefixes)
+      - suffix match against all 'literal$' expressions
+        (a single str.endswith() call, 'literal' + newline included)
+      - all other expressions (including unanchored 'literal')
+        merged into one alternation and searched with a single re.search(),
+        expressions that cannot be merged (e.g. backreferences)
+        are searched separately
+    Non-str keys are only checked for exact matches.
+
+    Matchers are built by aenv_diff_ignore_matcher()
+    and can be passed as keys_ignore to the aenv_*_diff filters.
+
+    repr() / str() is that of a dict with the original args
+    ({'keys_ignore': [...], 'keys_regexp_ignore': [...]}),
+    which is also accepted as keys_ignore. A matcher stored via set_fact
+    (converted to text and evaluated back in non-native templating)
+    therefore becomes that dict and not a str key.
+    """
+
+    __slots__ = [
+        'keys_ignore', 'keys_regexp_ignore',
+        'keys', 'prefixes', 'suffixes', 'searchv',
+    ]
+
+    def __init__(self, keys_ignore, keys_regexp_ignore):
+        super().__init__()
+        # original args as tuples
+        self.keys_ignore        = keys_ignore
+        self.keys_regexp_ignore = keys_regexp_ignore
+
+        self.keys     = set(keys_ignore)
+        self.prefixes = []
+        self.suffixes = []
+        self.searchv  = []
+
+        exprv_merge    = []
+        exprv_separate = []
+
+        for expr in keys_regexp_ignore:
+            anchor_start = expr.startswith('^')
+            # not handling escaped '$' at the end
+            anchor_end   = (expr.endswith('$') and not expr.endswith('\\$'))
+
+            literal = _regexp_get_literal(
+                expr[(1 if anchor_start else None):(-1 if anchor_end else None)]
+            )
+
+            if literal is None:
+                if _REGEXP_BACKREF_RE.search(expr):
+                    exprv_separate.append(expr)
+
+                else:
+                    # '(?i)expr' => '(?i:expr)' to allow merging
+                    exprv_merge.append(
+                        _REGEXP_GLOBAL_FLAGS_RE.sub(r'(?\1:', expr, count=1) + ')'
+                        if _REGEXP_GLOBAL_FLAGS_RE.match(expr)
+                        else expr
+                    )
+                # --
+
+            elif anchor_start and anchor_end:
+                # '$' also matches before a trailing newline
+                self.keys.add(literal)
+                self.keys.add(literal + '\n')
+
+            elif anchor_start:
+                self.prefixes.append(literal)
+
+            elif anchor_end:
+                # '$' also matches before a trailing newline
+                self.suffixes.append(literal)
+                self.suffixes.append(literal + '\n')
+
+            else:
+                exprv_merge.append(expr)
+            # --
+        # -- end for
+
+        if exprv_merge:
+            try:
+                self.searchv.append(
+                    re.compile('|'.join(('(?:{})'.format(e) for e in exprv_merge))).search
+                )
+            except re.error:
+                # fall back to separate expressions
+                exprv_separate.extend(exprv_merge)
+        # --
+
+        self.searchv.extend((re.compile(e).search for e in exprv_separate))
+
+        # str.startswith() / str.endswith() accept tuples
+        self.prefixes = (tuple(self.prefixes) or None)
+        self.suffixes = (tuple(self.suffixes) or None)
+    # --- end of __init__ (...) ---
+
+    def __reduce__(self):
+        return (self.__class__, (self.keys_ignore, self.keys_regexp_ignore))
+
+    def to_dict(self):
+        return {
+            'keys_ignore'        : list(self.keys_ignore),
+            'keys_regexp_ignore' : list(self.keys_regexp_ignore),
+        }
+    # --- end of to_dict (...) ---
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __bool__(self):
+        return bool(self.keys or self.prefixes or self.suffixes or self.searchv)
+
+    def _match_str(self, s):
+        # regexp-derived checks only (exact keys are checked separately)
+        if self.prefixes is not None and s.startswith(self.prefixes):
+            return True
+
+        elif self.suffixes is not None and s.endswith(self.suffixes):
+            return True
+
+        else:
+            for search in self.searchv:
+                if search(s):
+                    return True
+            # --
+
+            return False
+    # --- end of _match_str (...) ---
+
+    def __call__(self, key):
+        """Returns True if the given key should be ignored, else False."""
+        if key in self.keys:
+            return True
+
+        elif isinstance(key, str):
+            return self._match_str(key)
+
+        else:
+            return False
+    # --- end of __call__ (...) ---
+
+    def filter_keys(self, keys):
+        """Returns a set of all keys that should not be ignored."""
+        keys_remaining = set(keys)
+
+        if self.keys:
+            keys_remaining -= self.keys
+
+        if self.prefixes is None and self.suffixes is None and not self.searchv:
+            return keys_remaining
+
+        match_str = self._match_str
+
+        return {
+            k for k in keys_remaining
+            if not (isinstance(k, str) and match_str(k))
+        }
+    # --- end of filter_keys (...) ---
+
+# --- end of AenvKeyIgnoreMatcher ---
+
+if AnsibleDumper is not None:
+    AnsibleDumper.add_representer(
+        AenvKeyIgnoreMatcher,
+        (lambda dumper, data: dumper.represent_dict(data.to_dict()))
+    )
+# --
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_key_ignore_matcher(keys_ignore, keys_regexp_ignore):
+    return AenvKeyIgnoreMatcher(keys_ignore, keys_regexp_ignore)
+# --- end of _compile_key_ignore_matcher (...) ---
+
+
+def _get_key_ignore_matcher(keys_ignore=None, keys_regexp_ignore=None):
+    """Returns a (cached) matcher that checks whether a key should be ignored,
+    or None if no keys should be ignored at all.
+
+    keys_ignore may also be a prebuilt matcher or its dict form
+    (see AenvKeyIgnoreMatcher), which gets extended by keys_regexp_ignore if given.
+    """
+    if isinstance(keys_ignore, collections.abc.Mapping):
+        # matcher that went through set_fact
+        unknown_keys = set(keys_ignore) - {'keys_ignore', 'keys_regexp_ignore'}
+
+        if unknown_keys:
+            raise TypeError('keys_ignore dict has unknown keys', sorted(unknown_keys, key=str))
+
+        keys_ignore = _compile_key_ignore_matcher(
+            tuple(_convert_to_sequence(keys_ignore.get('keys_ignore') or ())),
+            tuple(_convert_to_sequence(keys_ignore.get('keys_regexp_ignore') or ())),
+        )
     # --
 
-    # mark keys for removal: apply keys_regexp_ignore if given
-    if keys_regexp_ignore:
-        keys_regexp_ignore_exprv = [
-            re.compile(expr) for expr in _convert_to_sequence(keys_regexp_ignore)
-        ]
-        keys_regexp_ignore_searchv = [
-            expr.search for expr in keys_regexp_ignore_exprv
-        ]
-
-        check_keys_regexp_ignored = (
-            lambda s, *, _fnv=keys_regexp_ignore_searchv:
-            any((_fn(s) for _fn in _fnv))
+    if isinstance(keys_ignore, AenvKeyIgnoreMatcher):
+        if not keys_regexp_ignore:
+            return (keys_ignore or None)
+        # --
+
+        keys_ignore_tuple        = keys_ignore.keys_ignore
+        keys_regexp_ignore_tuple = (
+            keys_ignore.keys_regexp_ignore
+            + tuple(_convert_to_sequence(keys_regexp_ignore))
         )
 
-        # NOTE: might check individual keys twice
-        # when both keys_ignore and keys_regexp_ignore are given
-        drop_keys_left.update((
-            s for s in keys_left if check_keys_regexp_ignored(s)
-        ))
+    else:
+        keys_ignore_tuple = (
+            tuple(_convert_to_sequence(keys_ignore)) if keys_ignore else ()
+        )
 
-        drop_keys_right.update((
-            s for s in keys_right if check_keys_regexp_ignored(s)
-        ))
+        keys_regexp_ignore_tuple = (
+            tuple(_convert_to_sequence(keys_regexp_ignore)) if keys_regexp_ignore else ()
+        )
+    # --
+
+    if not (keys_ignore_tuple or keys_regexp_ignore_tuple):
+        return None
     # --
 
-    # remove keys
-    if drop_keys_left:
-        keys_left -= drop_keys_left
+    return _compile_key_ignore_matcher(keys_ignore_tuple, keys_regexp_ignore_tuple)
+# --- end of _get_key_ignore_matcher (...) ---
+
+
+class AenvDiffResult(dict):
+    """Lazy diff result, see aenv_items_diff() and aenv_dict_diff().
+
+    A dict of bucket name => item map
+    (both, only_left, only_right and, for dict diffs, both_equal, both_diff).
+    All bucket names are present from the start, with a placeholder
+    value until the bucket gets computed. result[bucket] computes a single
+    bucket on first access, anything that reads all values (items(),
+    values(), comparison, JSON encoding, ...) computes all remaining
+    buckets first. It can therefore be used wherever a dict is expected
+    (e.g. combine, to_json, or templates/modules that modify the result).
+
+    Key sets and item counts of buckets are available via keys_of() / count()
+    without building the item maps.
+
+    Copying or pickling the result (e.g. when passing it between processes)
+    turns it into a plain dict containing all buckets.
+    repr() / str() are those of that dict, so that the result survives
+    Ansible's non-native templating (e.g. set_fact), which converts
+    the value to text and evaluates it back to a dict.
+    """
+
+    __slots__ = [
+        'dict_left', 'keys_left', 'dict_right', 'keys_right',
+        'keyfunc_cmp_left', 'keyfunc_cmp_right',
+        'bucket_names', '_key_sets',
+    ]
+
+    # value of buckets that have not been computed yet
+    _PENDING = object()
+
+    BUCKETS_ITEMS = ('both', 'only_left', 'only_right')
+    BUCKETS_DICT  = ('both', 'both_equal', 'both_diff', 'only_left', 'only_right')
+
+    def __init__(
+        self, dict_left, keys_left, dict_right, keys_right,
+        keyfunc_cmp_left=None, keyfunc_cmp_right=None
+    ):
+        bucket_names = (
+            self.BUCKETS_ITEMS if keyfunc_cmp_left is None else self.BUCKETS_DICT
+        )
+
+        # non-empty from the start: the JSON encoders skip empty dicts
+        # without calling items()
+        super().__init__(((bucket, self._PENDING) for bucket in bucket_names))
+        self.dict_left          = dict_left
+        self.keys_left          = keys_left
+        self.dict_right         = dict_right
+        self.keys_right         = keys_right
+        self.keyfunc_cmp_left   = keyfunc_cmp_left
+        self.keyfunc_cmp_right  = keyfunc_cmp_right
+
+        self.bucket_names = bucket_names
+        self._key_sets    = {}
+    # --- end of __init__ (...) ---
+
+    def with_cmp(self, keyfunc_cmp_left, keyfunc_cmp_right):
+        """Returns a new result that also offers both_equal / both_diff."""
+        return self.__class__(
+            self.dict_left, self.keys_left, self.dict_right, self.keys_right,
+            keyfunc_cmp_left=keyfunc_cmp_left, keyfunc_cmp_right=keyfunc_cmp_right
+        )
+    # --- end of with_cmp (...) ---
+
+    def _split_both(self):
+        dict_left         = self.dict_left
+        dict_right        = self.dict_right
+        keyfunc_cmp_left  = self.keyfunc_cmp_left
+        keyfunc_cmp_right = self.keyfunc_cmp_right
+
+        keys_equal = set()
+        keys_diff  = set()
+
+        for k in self.keys_of('both'):
+            if keyfunc_cmp_left(dict_left[k]) == keyfunc_cmp_right(dict_right[k]):
+                keys_equal.add(k)
+            else:
+                keys_diff.add(k)
+        # --
+
+        self._key_sets['both_equal'] = keys_equal
+        self._key_sets['both_diff']  = keys_diff
+    # --- end of _split_both (...) ---
+
+    def keys_of(self, bucket):
+        """Returns the key set of the given bucket."""
+        try:
+            return self._key_sets[bucket]
+        except KeyError:
+            pass
+
+        if bucket not in self.bucket_names:
+            raise KeyError(bucket)
+
+        elif bucket == 'both':
+            self._key_sets[bucket] = (self.keys_left & self.keys_right)
+
+        elif bucket == 'only_left':
+            self._key_sets[bucket] = (self.keys_left - self.keys_right)
+
+        elif bucket == 'only_right':
+            self._key_sets[bucket] = (self.keys_right - self.keys_left)
+
+        else:
+            self._split_both()
+        # --
+
+        return self._key_sets[bucket]
+    # --- end of keys_of (...) ---
+
+    def count(self, bucket):
+        """Returns the number of items in the given bucket."""
+        return len(self.keys_of(bucket))
+
+    def _build_bucket(self, bucket):
+        keys = self.keys_of(bucket)
+
+        if bucket == 'only_left':
+            dict_left = self.dict_left
+            item_map  = {k: dict_left[k] for k in keys}
+
+        elif bucket == 'only_right':
+            dict_right = self.dict_right
+            item_map   = {k: dict_right[k] for k in keys}
+
+        else:
+            # key -> (left, right)
+            dict_left  = self.dict_left
+            dict_right = self.dict_right
+            item_map   = {k: (dict_left[k], dict_right[k]) for k in keys}
+        # --
+
+        return item_map
+    # --- end of _build_bucket (...) ---
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+
+        if value is self._PENDING:
+            value = self._build_bucket(key)
+            super().__setitem__(key, value)
+        # --
+
+        return value
+    # --- end of __getitem__ (...) ---
+
+    def _fill(self):
+        """Computes all buckets that have not been accessed so far."""
+        for bucket in self.bucket_names:
+            if super().get(bucket) is self._PENDING:
+                super().__setitem__(bucket, self._build_bucket(bucket))
+        # --
+    # --- end of _fill (...) ---
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    # --- end of get (...) ---
+
+    # everything that reads values directly computes all buckets first
+
+    def __iter__(self):
+        # also makes dict(result) / {**result} use keys() and result[key]
+        # instead of copying the placeholders
+        return super().__iter__()
+
+    def __eq__(self, other):
+        self._fill()
+        if isinstance(other, AenvDiffResult):
+            other._fill()
+        return super().__eq__(other)
+    # --- end of __eq__ (...) ---
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    __hash__ = None
+
+    def values(self):
+        self._fill()
+        return super().values()
+
+    def items(self):
+        self._fill()
+        return super().items()
 
-    if drop_keys_right:
-        keys_right -= drop_keys_right
+    def pop(self, *args):
+        self._fill()
+        return super().pop(*args)
 
-    return (keys_left, keys_right)
+    def popitem(self):
+        self._fill()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self._fill()
+        return super().setdefault(key, default)
+
+    def copy(self):
+        return self.to_dict()
+
+    def __or__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+
+        result = self.to_dict()
+        result.update(other)
+        return result
+    # --- end of __or__ (...) ---
+
+    def __ror__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+
+        result = dict(other)
+        result.update(self.to_dict())
+        return result
+    # --- end of __ror__ (...) ---
+
+    def to_dict(self):
+        self._fill()
+        return dict(super().items())
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+    def __repr__(self):
+        return repr(self.to_dict())
+    # --- end of __repr__ (...) ---
+
+# --- end of AenvDiffResult ---
+
+if AnsibleDumper is not None:
+    # to_yaml / yaml callbacks
+    AnsibleDumper.add_representer(
+        AenvDiffResult,
+        (lambda dumper, data: dumper.represent_dict(data.to_dict()))
+    )
+# --
+
+
+def _aenv_items_diff_calc_key_sets(
+    dict_left, dict_right,
+    keys_ignore=None, keys_regexp_ignore=None
+):
+    """Helper function, see aenv_items_diff()."""
+    # build effective keys set for left / right,
+    # filtering out ignored keys in a single pass per side
+    matcher = _get_key_ignore_matcher(
+        keys_ignore=keys_ignore,
+        keys_regexp_ignore=keys_regexp_ignore
+    )
+
+    if matcher is None:
+        return (set(dict_left), set(dict_right))
+
+    else:
+        return (matcher.filter_keys(dict_left), matcher.filter_keys(dict_right))
 # --- end of _aenv_items_diff_calc_key_sets (...) ---
 
 
@@ -166,6 +894,10 @@ def aenv_items_diff(
     Certain keys can be ignored via the keys_ignore
     and keys_regexp_ignore keyword arguments.
     The latter one applies to str keys only.
+    keys_ignore may also be a prebuilt matcher (see aenv_diff_ignore_matcher()).
+
+    Either collection may also be a prebuilt index (see aenv_diff_index()),
+    in which case the key of the index is used and lkey/rkey is ignored.
 
     Example:
       >>> ['a', 'b', 'c'] | aenv_items_diff(['b', 'c', 'd'])
@@ -190,9 +922,10 @@ def aenv_items_diff(
     @type    right:     iterable|genexpr of C{object}
     @keyword key:       fallback key for lkey/rkey
                         Either None/True for identity (use item as key)
-                        or a string for getattr.
-                        Supports nested attributes separated by dot chars ('a.b').
-                        May also be a list of attributes.
+                        or a key path string for item/attribute lookup.
+                        Supports nested keys separated by dot chars ('a.b')
+                        and list indices ('a[0].b').
+                        May also be a list of key paths.
     @type    key:       C{None} | C{bool} | C{str}
     @keyword lkey:      preferred key for items from left (unless None)
     @type    lkey:      C{None} | C{bool} | C{str}
@@ -207,13 +940,14 @@ def aenv_items_diff(
                           - both       => (item_left, item_right)
                           - only_left  => item_left
                           - only_right => item_right
-    @rtype:             C{dict}
+                        (dict, buckets are computed on first access)
+    @rtype:             L{AenvDiffResult}
     """
     keyfunc_left  = _get_keyfunc(lkey or key)
     keyfunc_right = _get_keyfunc(rkey or key)
 
-    dict_left  = {keyfunc_left(o)  : o for o in _iter_sequence(left)}
-    dict_right = {keyfunc_right(o) : o for o in _iter_sequence(right)}
+    dict_left  = _get_key_dict(left, keyfunc_left)
+    dict_right = _get_key_dict(right, keyfunc_right)
 
     (keys_left, keys_right) = _aenv_items_diff_calc_key_sets(
         dict_left, dict_right,
@@ -221,23 +955,127 @@ def aenv_items_diff(
         keys_regexp_ignore=keys_regexp_ignore
     )
 
-    # cmp operation on key sets
-    kboth  = keys_left & keys_right
-    kdiff  = keys_left ^ keys_right
-    kleft  = kdiff - keys_right
-    kright = kdiff - keys_left
-
-    return {
-        # key -> (left, right)
-        'both'       : {k: (dict_left[k], dict_right[k]) for k in kboth},
-        # key -> left
-        'only_left'  : {k: dict_left[k] for k in kleft},
-        # key -> right
-        'only_right' : {k: dict_right[k] for k in kright},
-    }
+    return AenvDiffResult(dict_left, keys_left, dict_right, keys_right)
 # --- end of aenv_items_diff (...) ---
 
 
+def aenv_items_diff_iter(
+    left, right, *,
+    key=None, lkey=None, rkey=None,
+    keys_ignore=None, keys_regexp_ignore=None,
+    index='right'
+):
+    """Streaming variant of aenv_items_diff().
+
+    Instead of building key dicts for both collections,
+    only one side gets indexed (see the index keyword)
+    while the other side is streamed through that index.
+    Diff results are generated lazily as (bucket, key, item) tuples,
+    where bucket is one of 'both', 'only_left' or 'only_right'
+    and item is either (item_left, item_right) for 'both'
+    or the item from the respective side.
+
+    Results for the streamed side ('both' and 'only_left' with index='right')
+    are produced while the stream gets consumed,
+    results for the indexed side are produced after the stream is exhausted.
+
+    Peak memory usage is O(size of the indexed side),
+    so the smaller collection should be indexed.
+    The streamed side may be any iterable, including generators.
+    The indexed side may also be a prebuilt index (see aenv_diff_index()).
+
+    Key semantics (key / lkey / rkey, keys_ignore, keys_regexp_ignore)
+    are the same as for aenv_items_diff(), with one exception:
+    items with duplicate keys on the streamed side are reported once per item
+    whereas aenv_items_diff() keeps the last one only.
+
+    Example:
+      {% for bucket, k, item in wanted | aenv_items_diff_iter(current, key='name') %}
+
+    @param   left:      collection of items (left hand side)
+    @type    left:      iterable|genexpr of C{object}
+    @param   right:     collection of items (right hand side)
+    @type    right:     iterable|genexpr of C{object}
+    @keyword key:       fallback key for lkey/rkey, see aenv_items_diff()
+    @type    key:       C{None} | C{bool} | C{str}
+    @keyword lkey:      preferred key for items from left (unless None)
+    @type    lkey:      C{None} | C{bool} | C{str}
+    @keyword rkey:      preferred key for items from right (unless None)
+    @type    rkey:      C{None} | C{bool} | C{str}
+    @keyword keys_ignore:         listed keys should be ignored
+    @type    keys_ignore:         typically C{None} or iterable of C{object}
+    @keyword keys_regexp_ignore:  keys matching these regular expression(s) should be ignored
+    @type    keys_regexp_ignore:  typically C{None} or iterable of C{str}
+    @keyword index:     which side should be indexed, 'right' (default) or 'left'
+    @type    index:     C{str}
+
+    @returns:           generator of (bucket, key, item) tuples
+    @rtype:             generator of 3-tuple
+    """
+    def iter_diff(
+        stream, stream_keyfunc, stream_bucket,
+        indexed, index_keyfunc, index_bucket,
+        check_key_ignored, make_pair
+    ):
+        # ignored keys are kept in the index (which may be shared),
+        # they never get matched and are filtered out on output
+        dict_index   = _get_key_dict(indexed, index_keyfunc)
+        keys_matched = set()
+
+        for o in _iter_sequence(stream):
+            k = stream_keyfunc(o)
+
+            if check_key_ignored is not None and check_key_ignored(k):
+                pass
+
+            else:
+                try:
+                    o_index = dict_index[k]
+                except KeyError:
+                    yield (stream_bucket, k, o)
+                else:
+                    keys_matched.add(k)
+                    yield ('both', k, make_pair(o, o_index))
+            # --
+        # -- end for
+
+        for k, o_index in dict_index.items():
+            if k in keys_matched:
+                pass
+
+            elif check_key_ignored is None or not check_key_ignored(k):
+                yield (index_bucket, k, o_index)
+        # --
+    # --- end of iter_diff (...) ---
+
+    keyfunc_left  = _get_keyfunc(lkey or key)
+    keyfunc_right = _get_keyfunc(rkey or key)
+
+    check_key_ignored = _get_key_ignore_matcher(
+        keys_ignore=keys_ignore,
+        keys_regexp_ignore=keys_regexp_ignore
+    )
+
+    # validate args now, not when the generator gets consumed
+    if index == 'right':
+        return iter_diff(
+            left, keyfunc_left, 'only_left',
+            right, keyfunc_right, 'only_right',
+            check_key_ignored, (lambda s, i: (s, i))
+        )
+
+    elif index == 'left':
+        return iter_diff(
+            right, keyfunc_right, 'only_right',
+            left, keyfunc_left, 'only_left',
+            check_key_ignored, (lambda s, i: (i, s))
+        )
+
+    else:
+        raise ValueError('index must be either left or right', index)
+# --- end of aenv_items_diff_iter (...) ---
+
+
 def aenv_dict_diff(left, right, *, cmp_key=None, cmp_lkey=None, cmp_rkey=None, **kwargs):
     """Given two item collections left and right,
     this filter functions determines which items
@@ -265,9 +1103,10 @@ def aenv_dict_diff(left, right, *, cmp_key=None, cmp_lkey=None, cmp_rkey=None, *
     @type    right:     iterable|genexpr of C{object}
     @keyword key:       fallback key for lkey/rkey
                         Either None/True for identity (use item as key)
-                        or a string for getattr.
-                        Supports nested attributes separated by dot chars ('a.b').
-                        May also be a list of attributes.
+                        or a key path string for item/attribute lookup.
+                        Supports nested keys separated by dot chars ('a.b')
+                        and list indices ('a[0].b').
+                        May also be a list of key paths.
     @type    key:       C{None} | C{bool} | C{str}
     @keyword lkey:      preferred key for items from left (unless None)
     @type    lkey:      C{None} | C{bool} | C{str}
@@ -292,33 +1131,396 @@ def aenv_dict_diff(left, right, *, cmp_key=None, cmp_lkey=None, cmp_rkey=None, *
                           - both_diff  => (item_left, item_right)
                           - only_left  => item_left
                           - only_right => item_right
-    @rtype:             C{dict}
+                        (dict, buckets are computed on first access)
+    @rtype:             L{AenvDiffResult}
     """
 
     keyfunc_cmp_left  = _get_keyfunc(cmp_lkey or cmp_key)
     keyfunc_cmp_right = _get_keyfunc(cmp_rkey or cmp_key)
 
     items_diff_result = aenv_items_diff(left, right, **kwargs)
-    items_both = items_diff_result['both']
 
-    items_both_equal = {}
-    items_both_diff  = {}
+    return items_diff_result.with_cmp(keyfunc_cmp_left, keyfunc_cmp_right)
+# --- end of aenv_dict_diff (...) ---
+
+
+def aenv_dict_diff_many(
+    left, targets, *,
+    key=None, lkey=None, rkey=None,
+    cmp_key=None, cmp_lkey=None, cmp_rkey=None,
+    keys_ignore=None, keys_regexp_ignore=None,
+    summary_only=False
+):
+    """Compares one reference collection (left hand side)
+    against several named target collections (right hand side).
+
+    This is equivalent to calling aenv_dict_diff() for each target,
+    but key functions, ignore matchers and the reference index
+    are built only once.
+
+    Example:
+      >>> wanted_users | aenv_dict_diff_many(
+      ...     {'web': web_users, 'db': db_users}, key='name', summary_only=True
+      ... )
+      {
+        'web': {'both': 3, 'both_equal': 2, 'both_diff': 1, 'only_left': 0, 'only_right': 1},
+        'db':  {...},
+      }
+
+    @param   left:      reference collection of items (left hand side)
+    @type    left:      iterable|genexpr of C{object}
+    @param   targets:   mapping of target name => collection of items (right hand side)
+    @type    targets:   C{dict} of C{str} => iterable of C{object}
+
+    @keyword key, lkey, rkey:               see aenv_items_diff()
+    @keyword cmp_key, cmp_lkey, cmp_rkey:   see aenv_dict_diff()
+    @keyword keys_ignore:         listed keys should be ignored
+    @type    keys_ignore:         typically C{None} or iterable of C{object}
+    @keyword keys_regexp_ignore:  keys matching these regular expression(s) should be ignored
+    @type    keys_regexp_ignore:  typically C{None} or iterable of C{str}
+    @keyword summary_only:  return item counts per bucket instead of item maps
+    @type    summary_only:  C{bool}
+
+    @returns:           target name => diff result (see aenv_dict_diff())
+                        or target name => bucket name => item count
+    @rtype:             C{dict}
+    """
+    keyfunc_left  = _get_keyfunc(lkey or key)
+    keyfunc_right = _get_keyfunc(rkey or key)
+
+    keyfunc_cmp_left  = _get_keyfunc(cmp_lkey or cmp_key)
+    keyfunc_cmp_right = _get_keyfunc(cmp_rkey or cmp_key)
+
+    matcher = _get_key_ignore_matcher(
+        keys_ignore=keys_ignore,
+        keys_regexp_ignore=keys_regexp_ignore
+    )
+
+    dict_left = _get_key_dict(left, keyfunc_left)
+    keys_left = (set(dict_left) if matcher is None else matcher.filter_keys(dict_left))
+
+    results = {}
+
+    for target_name, right in targets.items():
+        dict_right = _get_key_dict(right, keyfunc_right)
+        keys_right = (set(dict_right) if matcher is None else matcher.filter_keys(dict_right))
 
-    for item_key, item in items_both.items():
-        item_cmp_key_left  = keyfunc_cmp_left(item[0])
-        item_cmp_key_right = keyfunc_cmp_right(item[1])
+        items_diff_result = AenvDiffResult(
+            dict_left, keys_left, dict_right, keys_right,
+            keyfunc_cmp_left=keyfunc_cmp_left, keyfunc_cmp_right=keyfunc_cmp_right
+        )
+
+        if summary_only:
+            results[target_name] = {
+                bucket: items_diff_result.count(bucket)
+                for bucket in items_diff_result.bucket_names
+            }
+
+        else:
+            results[target_name] = items_diff_result
+        # --
+    # -- end for
+
+    return results
+# --- end of aenv_dict_diff_many (...) ---
+
+
+def _canonical_sort_key(obj):
+    """Returns a sort key for dict keys / set items in _canonical_digest().
+
+    Keys are (<tag>, <value>), with the same type tags as the digest,
+    so that subclasses (e.g. AnsibleUnsafeText) sort like their base type
+    and values of different types (1 vs '1') do not compare equal.
+    """
+    if obj is None:
+        return ('n', 0)
+
+    elif isinstance(obj, bool):
+        return ('b', int(obj))
+
+    elif isinstance(obj, int):
+        return ('i', int(obj))
+
+    elif isinstance(obj, float):
+        return ('f', float(obj))
+
+    elif isinstance(obj, str):
+        return ('s', str(obj))
+
+    elif isinstance(obj, bytes):
+        return ('y', bytes(obj))
+
+    elif hasattr(obj, '__iter__'):
+        # tuples, frozensets: no natural order across item types
+        return ('l', _canonical_digest(obj))
+
+    else:
+        return ('o', str(obj))
+# --- end of _canonical_sort_key (...) ---
+
+
+def _canonical_digest(obj):
+    """Computes a stable digest of a nested data structure.
+
+    Dict keys and sets get sorted, so insertion order does not matter.
+    Nested structures are processed iteratively (no recursion limit).
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    update = hasher.update
+    stack  = [obj]
+
+    while stack:
+        o = stack.pop()
+
+        if o is None:
+            update(b'n;')
+
+        elif isinstance(o, bool):
+            update(b'b1;' if o else b'b0;')
+
+        elif isinstance(o, int):
+            update(b'i%d;' % o)
+
+        elif isinstance(o, float):
+            update(b'f' + repr(o).encode('ascii') + b';')
+
+        elif isinstance(o, str):
+            o_bytes = o.encode('utf-8', 'surrogateescape')
+            update(b's%d:' % len(o_bytes))
+            update(o_bytes)
+
+        elif isinstance(o, bytes):
+            update(b'y%d:' % len(o))
+            update(o)
+
+        elif hasattr(o, 'items'):
+            o_items = sorted(o.items(), key=lambda kv: _canonical_sort_key(kv[0]))
+            update(b'd%d:' % len(o_items))
+
+            # push reversed so that the first key gets processed next
+            for k, v in reversed(o_items):
+                stack.append(v)
+                stack.append(k)
+
+        elif isinstance(o, (set, frozenset)):
+            o_items = sorted(o, key=_canonical_sort_key)
+            update(b'e%d:' % len(o_items))
+            stack.extend(reversed(o_items))
+
+        elif hasattr(o, '__iter__'):
+            o_items = list(o)
+            update(b'l%d:' % len(o_items))
+            stack.extend(reversed(o_items))
 
-        if item_cmp_key_left == item_cmp_key_right:
-            items_both_equal[item_key] = item
         else:
-            items_both_diff[item_key] = item
+            o_bytes = str(o).encode('utf-8', 'surrogateescape')
+            update(b'o%d:' % len(o_bytes))
+            update(o_bytes)
         # --
+    # -- end while
+
+    return hasher.hexdigest()
+# --- end of _canonical_digest (...) ---
+
+
+def aenv_items_digest(
+    arg, *, key=None, cmp_key=None, keys_ignore=None, keys_regexp_ignore=None
+):
+    """Computes stable content digests for a collection of items.
+
+    Items are identified by key (see aenv_items_diff()),
+    their content is determined by cmp_key (whole item by default).
+    Item keys are converted to str so that the result can be stored as JSON.
+
+    @param   arg:       collection of items
+    @type    arg:       iterable|genexpr of C{object}
+    @keyword key:       item key spec, see aenv_items_diff()
+    @type    key:       C{None} | C{bool} | C{str}
+    @keyword cmp_key:   content key spec, see aenv_dict_diff()
+    @type    cmp_key:   C{None} | C{bool} | C{str}
+    @keyword keys_ignore:         listed keys should be ignored
+    @type    keys_ignore:         typically C{None} or iterable of C{object}
+    @keyword keys_regexp_ignore:  keys matching these regular expression(s) should be ignored
+    @type    keys_regexp_ignore:  typically C{None} or iterable of C{str}
+
+    @returns:           item key => hex digest
+    @rtype:             C{dict} of C{str} => C{str}
+    """
+    keyfunc     = _get_keyfunc(key)
+    keyfunc_cmp = _get_keyfunc(cmp_key)
+
+    check_key_ignored = _get_key_ignore_matcher(
+        keys_ignore=keys_ignore,
+        keys_regexp_ignore=keys_regexp_ignore
+    )
+
+    digests = {}
+
+    for o in _iter_sequence(arg):
+        k = keyfunc(o)
+
+        if check_key_ignored is None or not check_key_ignored(k):
+            digests[(k if isinstance(k, str) else str(k))] = (
+                _canonical_digest(keyfunc_cmp(o))
+            )
     # --
 
-    items_diff_result['both_equal'] = items_both_equal
-    items_diff_result['both_diff'] = items_both_diff
-    return items_diff_result
-# --- end of aenv_dict_diff (...) ---
+    return digests
+# --- end of aenv_items_digest (...) ---
+
+
+def aenv_digest_delta(
+    arg, previous, *, key=None, cmp_key=None, keys_ignore=None, keys_regexp_ignore=None
+):
+    """Determines which items have changed since a previous run
+    by comparing their content digests against previously recorded ones
+    (see aenv_items_digest()).
+
+    The previous digests are typically read from the control node
+    via the aenv_digest_state lookup plugin, and the new digests
+    should be written back after the changes have been applied successfully:
+
+      - set_fact:
+          users_delta: >-
+            {{ wanted_users | aenv_digest_delta(
+                lookup('aenv_digest_state', 'users'), key='name') }}
+
+      - ... loop: "{{ users_delta.changed.values() | list }}"
+
+      - file:
+          state: directory
+          path:  "{{ lookup('aenv_digest_state', 'users', path=true) | dirname }}"
+        delegate_to: localhost
+
+      - copy:
+          content: "{{ users_delta.digests | to_json }}"
+          dest:    "{{ lookup('aenv_digest_state', 'users', path=true) }}"
+        delegate_to: localhost
+
+    @param   arg:       collection of items
+    @type    arg:       iterable|genexpr of C{object}
+    @param   previous:  previously recorded digests (may be empty or None)
+    @type    previous:  C{None} | C{dict} of C{str} => C{str}
+    @keyword key:       item key spec, see aenv_items_diff()
+    @type    key:       C{None} | C{bool} | C{str}
+    @keyword cmp_key:   content key spec, see aenv_dict_diff()
+    @type    cmp_key:   C{None} | C{bool} | C{str}
+    @keyword keys_ignore:         listed keys should be ignored
+    @type    keys_ignore:         typically C{None} or iterable of C{object}
+    @keyword keys_regexp_ignore:  keys matching these regular expression(s) should be ignored
+    @type    keys_regexp_ignore:  typically C{None} or iterable of C{str}
+
+    @returns:           delta mapping containing these keys / values:
+                          - changed   => item key => item (new or modified items)
+                          - unchanged => list of item keys
+                          - removed   => list of item keys (recorded, but gone now)
+                          - digests   => item key => digest (all current items)
+    @rtype:             C{dict}
+    """
+    keyfunc     = _get_keyfunc(key)
+    keyfunc_cmp = _get_keyfunc(cmp_key)
+
+    check_key_ignored = _get_key_ignore_matcher(
+        keys_ignore=keys_ignore,
+        keys_regexp_ignore=keys_regexp_ignore
+    )
+
+    if not previous:
+        previous = {}
+
+    changed   = {}
+    unchanged = []
+    digests   = {}
+
+    for o in _iter_sequence(arg):
+        k = keyfunc(o)
+
+        if check_key_ignored is None or not check_key_ignored(k):
+            k_str  = (k if isinstance(k, str) else str(k))
+            digest = _canonical_digest(keyfunc_cmp(o))
+
+            digests[k_str] = digest
+
+            if previous.get(k_str) == digest:
+                unchanged.append(k_str)
+            else:
+                changed[k_str] = o
+        # --
+    # --
+
+    return {
+        'changed'   : changed,
+        'unchanged' : unchanged,
+        'removed'   : [k for k in previous if k not in digests],
+        'digests'   : digests,
+    }
+# --- end of aenv_digest_delta (...) ---
+
+
+def aenv_diff_ignore_matcher(keys_ignore=None, keys_regexp_ignore=None):
+    """Builds a reusable matcher for keys_ignore / keys_regexp_ignore
+    that can be passed as keys_ignore to the aenv_*_diff filters.
+
+    The matcher is an in-memory object. Storing it via set_fact turns it
+    into a dict of its args (see AenvKeyIgnoreMatcher), which the diff filters
+    accept as keys_ignore as well, but recompile (cached) on use.
+
+    Example:
+      {% set users_ignore = builtin_users | aenv_diff_ignore_matcher(['^systemd-', '^_']) %}
+      {% set diff_a = wanted_users | aenv_dict_diff(users_a, keys_ignore=users_ignore) %}
+      {% set diff_b = wanted_users | aenv_dict_diff(users_b, keys_ignore=users_ignore) %}
+
+    @param   keys_ignore:         listed keys should be ignored
+    @type    keys_ignore:         typically C{None} or iterable of C{object}
+    @param   keys_regexp_ignore:  keys matching these regular expression(s) should be ignored
+    @type    keys_regexp_ignore:  typically C{None} or iterable of C{str}
+
+    @returns:           key matcher
+    @rtype:             L{AenvKeyIgnoreMatcher}
+    """
+    return (
+        _get_key_ignore_matcher(keys_ignore, keys_regexp_ignore)
+        or _compile_key_ignore_matcher((), ())
+    )
+# --- end of aenv_diff_ignore_matcher (...) ---
+
+
+def aenv_diff_index(arg, key=None):
+    """Builds a reusable key => item index from a collection of items.
+
+    The index can be passed to aenv_items_diff(), aenv_items_diff_iter()
+    and aenv_dict_diff() in place of the collection,
+    which avoids rebuilding the same key dict for each diff.
+
+    The index is an in-memory object, reuse it within a single template.
+    Storing it via set_fact does not work (it gets converted to a string,
+    unless jinja2 native types are enabled).
+    Indexes are not cached across templates: Ansible re-templates
+    variables into new objects and runs tasks in forked workers,
+    a cached index could not be validated more cheaply than rebuilding it.
+
+    Example:
+      {% set wanted_users_index = wanted_users | aenv_diff_index('name') %}
+      {% set diff_a = wanted_users_index | aenv_dict_diff(users_a, key='name') %}
+      {% set diff_b = wanted_users_index | aenv_dict_diff(users_b, key='name') %}
+
+    @param   arg:       collection of items
+    @type    arg:       iterable|genexpr of C{object}
+    @param   key:       key spec, see aenv_items_diff()
+    @type    key:       C{None} | C{bool} | C{str} | C{list} of C{str}
+
+    @returns:           prebuilt index
+    @rtype:             L{AenvDiffIndex}
+    """
+    if isinstance(arg, AenvDiffIndex):
+        if _normalize_key_spec(key) == arg.key:
+            return arg
+        else:
+            raise ValueError('index was built with a different key', arg.key, key)
+    # --
+
+    return AenvDiffIndex.new_from_sequence(arg, key)
+# --- end of aenv_diff_index (...) ---
 
 
 class FilterModule(object):
@@ -327,6 +1529,12 @@ class FilterModule(object):
     def filters(self):
         return {
             # misc
-            'aenv_items_diff' : aenv_items_diff,
-            'aenv_dict_diff'  : aenv_dict_diff,
+            'aenv_items_diff'          : aenv_items_diff,
+            'aenv_items_diff_iter'     : aenv_items_diff_iter,
+            'aenv_dict_diff'           : aenv_dict_diff,
+            'aenv_dict_diff_many'      : aenv_dict_diff_many,
+            'aenv_diff_index'          : aenv_diff_index,
+            'aenv_diff_ignore_matcher' : aenv_diff_ignore_matcher,
+            'aenv_items_digest'        : aenv_items_digest,
+            'aenv_digest_delta'        : aenv_digest_delta,
         }
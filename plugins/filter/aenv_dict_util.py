@@ -14,7 +14,11 @@
 
 # Python >= 3.7 only
 
+import functools
+import heapq
 import operator
+import re
+
 from ansible.module_utils.common.collections import is_sequence
 
 
@@ -58,28 +62,122 @@ def dict_extract_false(dict_arg):
 # --- end of dict_extract_false (...) ---
 
 
-def _dict_sort(dict_arg, *, key=None):
+_NATURAL_SORT_SPLIT_RE = re.compile(r'([0-9]+)')
+
+
+@functools.lru_cache(maxsize=4096)
+def _natural_sort_key_str(arg):
+    # '1.10.2-r1' => ((0, 1, ''), (1, 0, '.'), (0, 10, ''), ..., (1, 0, '-r'), (0, 1, ''))
+    # digit chunks compare numerically and sort before text chunks
+    return tuple((
+        ((0, int(chunk), '') if (idx % 2) else (1, 0, chunk))
+        for idx, chunk in enumerate(_NATURAL_SORT_SPLIT_RE.split(arg))
+        if chunk
+    ))
+# --- end of _natural_sort_key_str (...) ---
+
+
+def _natural_sort_key(arg):
+    """Natural / version-aware sort key ('a2' < 'a10', '1.9' < '1.10').
+
+    Keys are memoized per str value, non-str values are converted to str.
+    """
+    return _natural_sort_key_str(arg if isinstance(arg, str) else str(arg))
+# --- end of _natural_sort_key (...) ---
+
+
+def _get_dict_sort_keyfunc(dict_arg, by, natural):
+    """Returns a sort key function that operates on dict keys only,
+    so that sorting does not need to materialize the item list."""
+    if by == 'key':
+        return (_natural_sort_key if natural else None)
+
+    elif by == 'value':
+        if natural:
+            return (lambda k, *, _d=dict_arg: _natural_sort_key(_d[k]))
+        else:
+            return dict_arg.__getitem__
+
+    else:
+        raise ValueError('by must be either key or value', by)
+# --- end of _get_dict_sort_keyfunc (...) ---
+
+
+def _dict_sort(dict_arg, *, key=None, reverse=False):
     if key is None:
         key = lambda kv: kv[0]
 
-    return sorted(dict_arg.items(), key=key)
+    return sorted(dict_arg.items(), key=key, reverse=reverse)
 # --- end of _dict_sort (...) ---
 
 
-def dict_sort_keys(dict_arg, *, key=None):
-    """Returns a sorted list of keys from the given dictionary."""
-    # return sorted(dict_arg)
-    return [k for k, v in _dict_sort(dict_arg, key=key)]
+def _dict_sort_keys_only(dict_arg, *, by='key', natural=False, reverse=False):
+    return sorted(
+        dict_arg, key=_get_dict_sort_keyfunc(dict_arg, by, natural), reverse=reverse
+    )
+# --- end of _dict_sort_keys_only (...) ---
+
+
+def dict_sort_keys(dict_arg, *, key=None, by='key', natural=False, reverse=False):
+    """Returns a sorted list of keys from the given dictionary.
+
+    By default, keys are sorted by themselves (by='key'),
+    use by='value' to sort keys by their value.
+    natural=True enables natural / version-aware sorting.
+
+    A custom key function operating on (key, value) tuples
+    may be given via key (overrides by / natural).
+    """
+    if key is not None:
+        return [k for k, v in _dict_sort(dict_arg, key=key, reverse=reverse)]
+    else:
+        return _dict_sort_keys_only(dict_arg, by=by, natural=natural, reverse=reverse)
 # --- end of dict_sort_keys (...) ---
 
 
-def dict_sort_values(dict_arg, *, key=None):
+def dict_sort_values(dict_arg, *, key=None, by='key', natural=False, reverse=False):
     """Returns a sorted list of values from the given dictionary.
-    By default, values are sorted by their dict key."""
-    return [v for k, v in _dict_sort(dict_arg, key=key)]
+    By default, values are sorted by their dict key.
+    See dict_sort_keys() for the keyword arguments."""
+    if key is not None:
+        return [v for k, v in _dict_sort(dict_arg, key=key, reverse=reverse)]
+
+    elif by == 'value':
+        return sorted(
+            dict_arg.values(), key=(_natural_sort_key if natural else None), reverse=reverse
+        )
+
+    else:
+        return [
+            dict_arg[k] for k in
+            _dict_sort_keys_only(dict_arg, by=by, natural=natural, reverse=reverse)
+        ]
 # --- end of dict_sort_values (...) ---
 
 
+def _dict_select_k(select_func, dict_arg, num, *, by, natural):
+    keys = select_func(num, dict_arg, key=_get_dict_sort_keyfunc(dict_arg, by, natural))
+    return {k: dict_arg[k] for k in keys}
+# --- end of _dict_select_k (...) ---
+
+
+def dict_topk(dict_arg, num, *, by='value', natural=False):
+    """Returns the num entries with the largest values (or keys with by='key')
+    as dict, in descending order.
+
+    Uses a heap, which is cheaper than sorting the whole dict for small num.
+    """
+    return _dict_select_k(heapq.nlargest, dict_arg, num, by=by, natural=natural)
+# --- end of dict_topk (...) ---
+
+
+def dict_bottomk(dict_arg, num, *, by='value', natural=False):
+    """Returns the num entries with the smallest values (or keys with by='key')
+    as dict, in ascending order. See dict_topk()."""
+    return _dict_select_k(heapq.nsmallest, dict_arg, num, by=by, natural=natural)
+# --- end of dict_bottomk (...) ---
+
+
 def dict_fromkeys(arg, *, value=True):
     return {k: value for k in _convert_to_sequence(arg)}
 # --- end of dict_fromkeys (...) ---
@@ -95,5 +193,7 @@ class FilterModule(object):
 
             'aenv_dictsort_keys'        : dict_sort_keys,
             'aenv_dictsort_values'      : dict_sort_values,
+            'aenv_dict_topk'            : dict_topk,
+            'aenv_dict_bottomk'         : dict_bottomk,
             'aenv_dict_fromkeys'        : dict_fromkeys,
         }
@@ -18,6 +18,18 @@ import functools
 
 from jinja2.runtime import Undefined
 
+from ansible.module_utils.common.collections import is_sequence
+
+
+# lazy copy-paste
+def _convert_to_sequence(arg):
+    """Converts arg so that it can be processed as a list-like object."""
+    if is_sequence(arg):
+        return arg
+    else:
+        return [arg]
+# --- end of _convert_to_sequence (...) ---
+
 
 def str_to_bool(arg):
     if isinstance(arg, bool):
@@ -53,13 +65,29 @@ bool_str_yesno = functools.partial(_bool_str, 'yes', 'no')
 bool_str_int   = functools.partial(_bool_str, '1', '0')
 
 
+def _split_host_domain(arg, default_domain):
+    hostname, sep, domain = arg.rstrip('.').partition('.')
+
+    return ((hostname or Undefined), (domain or default_domain))
+# --- end of _split_host_domain (...) ---
+
+# bounded memo for repeated FQDNs (batch filters, loops)
+_split_host_domain_cached = functools.lru_cache(maxsize=4096)(_split_host_domain)
+
+
 def split_host_domain(arg, default_domain=Undefined):
     if (not arg) or (arg is Undefined):
         return (Undefined, default_domain)
-    else:
-        hostname, sep, domain = arg.rstrip('.').partition('.')
 
-        return ((hostname or Undefined), (domain or default_domain))
+    elif isinstance(arg, str):
+        try:
+            return _split_host_domain_cached(arg, default_domain)
+        except TypeError:
+            # unhashable default_domain
+            return _split_host_domain(arg, default_domain)
+
+    else:
+        return _split_host_domain(arg, default_domain)
 # --- end of split_host_domain (...) ---
 
 
@@ -76,6 +104,91 @@ def split_domain(arg):
 # --- end of split_domain (...) ---
 
 
+def _map_collection(func, arg):
+    """Applies func to each value of a list-like or dict-like arg
+    and returns a list or dict (same keys), respectively.
+    Other values (e.g. a single str) are treated as one-element list."""
+    if hasattr(arg, 'items'):
+        return {k: func(v) for k, v in arg.items()}
+    else:
+        return [func(v) for v in _convert_to_sequence(arg)]
+# --- end of _map_collection (...) ---
+
+
+def split_host_domain_batch(arg, default_domain=Undefined):
+    """Splits a list (or dict) of fully-qualified domain names
+    into hostname and domain columns.
+
+    Example:
+      >>> ['a.example.org', 'b'] | aenv_split_hostnames(default_domain='lan')
+      {'hosts': ['a', 'b'], 'domains': ['example.org', 'lan']}
+
+    For dict input, both columns are dicts with the same keys.
+    """
+    pairs = _map_collection(
+        (lambda v: split_host_domain(v, default_domain)), arg
+    )
+
+    if isinstance(pairs, dict):
+        return {
+            'hosts'   : {k: v[0] for k, v in pairs.items()},
+            'domains' : {k: v[1] for k, v in pairs.items()},
+        }
+
+    else:
+        return {
+            'hosts'   : [v[0] for v in pairs],
+            'domains' : [v[1] for v in pairs],
+        }
+# --- end of split_host_domain_batch (...) ---
+
+
+def short_hostname_batch(arg):
+    """Returns the hostnames of a list (or dict) of fully-qualified domain names."""
+    return _map_collection((lambda v: split_host_domain(v)[0]), arg)
+# --- end of short_hostname_batch (...) ---
+
+
+def split_domain_batch(arg):
+    """Returns the domain paths of a list (or dict) of fully-qualified domain names."""
+    return _map_collection((lambda v: split_host_domain(v)[1]), arg)
+# --- end of split_domain_batch (...) ---
+
+
+_NO_DEFAULT = object()
+
+
+def str_to_bool_batch(arg, default=_NO_DEFAULT):
+    """Converts all values of a list (or dict) to bool,
+    a single value is treated as one-element list.
+
+    Invalid values are collected and reported together (ValueError)
+    unless a default value is given, which is then used instead.
+    """
+    bad_values = []
+
+    def convert(idx, value):
+        try:
+            return str_to_bool(value)
+        except (TypeError, ValueError):
+            if default is _NO_DEFAULT:
+                bad_values.append((idx, value))
+            return default
+    # --- end of convert (...) ---
+
+    if hasattr(arg, 'items'):
+        ret = {k: convert(k, v) for k, v in arg.items()}
+    else:
+        ret = [convert(idx, v) for idx, v in enumerate(_convert_to_sequence(arg))]
+    # --
+
+    if bad_values:
+        raise ValueError('not bool words', bad_values)
+
+    return ret
+# --- end of str_to_bool_batch (...) ---
+
+
 class FilterModule(object):
     ''' Ansible jinja2 filters - misc/generic '''
 
@@ -90,4 +203,10 @@ class FilterModule(object):
             # misc
             'aenv_hostname'         : short_hostname,
             'aenv_domainname'       : split_domain,
+
+            # batch variants (list or dict input)
+            'aenv_bool_map'         : str_to_bool_batch,
+            'aenv_hostnames'        : short_hostname_batch,
+            'aenv_domainnames'      : split_domain_batch,
+            'aenv_split_hostnames'  : split_host_domain_batch,
         }
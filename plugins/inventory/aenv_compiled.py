@@ -0,0 +1,148 @@
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+# Python >= 3.7 only
+
+# Reads inventory snapshots created by the wrapper (AENV_COMPILED_INVENTORY=1),
+# which are the output of:
+#
+#   ansible-inventory -i <inventory> --list --export --output <file>.aenv-compiled.json
+#
+# with vars plugins disabled, so the snapshot only has the host/group
+# structure and the vars defined by the inventory sources.
+# The inventory's group_vars/host_vars dirs are symlinked next to the
+# snapshot and get loaded by the vars plugins as usual.
+#
+# Only files ending with .aenv-compiled.json are accepted.
+# The wrapper enables this plugin via ANSIBLE_INVENTORY_ENABLED.
+#
+# Vault-encrypted values ({"__ansible_vault": ...}) and unsafe values
+# ({"__ansible_unsafe": ...}) are restored by Ansible's JSON decoder.
+# Groups and hosts get added in inventory order (depth-first from "all"),
+# so that the host order matches the original inventory.
+#
+# The magic vars inventory_file/inventory_dir would point to the snapshot
+# in the wrapper's cache dir, they get set to the original inventory
+# from <file>.meta.json (written by the wrapper) instead.
+#
+
+import json
+
+from ansible.errors import AnsibleParserError
+from ansible.plugins.inventory import BaseInventoryPlugin
+
+
+DOCUMENTATION = '''
+    name: aenv_compiled
+    short_description: Inventory snapshots created by the aenv wrapper
+    description:
+        - Loads C(ansible-inventory --list --export) JSON output
+          from files ending with C(.aenv-compiled.json).
+'''
+
+
+class InventoryModule(BaseInventoryPlugin):
+
+    NAME = 'aenv_compiled'
+
+    FILE_SUFFIX = '.aenv-compiled.json'
+
+    META_FILE_SUFFIX = '.meta.json'
+
+    def verify_file(self, path):
+        return (
+            super().verify_file(path)
+            and path.endswith(self.FILE_SUFFIX)
+        )
+    # --- end of verify_file (...) ---
+
+    def read_meta(self, path):
+        meta_file = path[:-len(self.FILE_SUFFIX)] + self.META_FILE_SUFFIX
+
+        try:
+            with open(meta_file, 'rt') as fh:
+                meta = json.load(fh)
+
+        except (OSError, ValueError):
+            return {}
+
+        return (meta if isinstance(meta, dict) else {})
+    # --- end of read_meta (...) ---
+
+    def parse(self, inventory, loader, path, cache=True):
+        super().parse(inventory, loader, path, cache=cache)
+
+        try:
+            with open(path, 'rt') as fh:
+                data = self.loader.load(fh.read(), file_name=path, json_only=True)
+
+        except (OSError, ValueError) as err:
+            raise AnsibleParserError(f'aenv_compiled: failed to read {path}: {err}')
+        # --
+
+        if not isinstance(data, dict):
+            raise AnsibleParserError(f'aenv_compiled: not a dict: {path}')
+        # --
+
+        hostvars = data.pop('_meta', {}).get('hostvars', {})
+
+        groups_done = set()
+        hosts_done  = set()
+
+        def add_group(group_name):
+            if group_name in groups_done:
+                return
+
+            groups_done.add(group_name)
+
+            group_data = data.get(group_name) or {}
+            self.inventory.add_group(group_name)
+
+            for varname, value in (group_data.get('vars') or {}).items():
+                self.inventory.set_variable(group_name, varname, value)
+
+            for host_name in (group_data.get('hosts') or ()):
+                self.inventory.add_host(host_name, group=group_name)
+                hosts_done.add(host_name)
+
+            for child_name in (group_data.get('children') or ()):
+                add_group(child_name)
+                self.inventory.add_child(group_name, child_name)
+            # --
+        # --- end of add_group (...) ---
+
+        add_group('all')
+
+        # groups not reachable from "all" (should not happen)
+        for group_name in data:
+            add_group(group_name)
+
+        for host_name, host_vars in hostvars.items():
+            self.inventory.add_host(host_name)
+            hosts_done.add(host_name)
+
+            for varname, value in (host_vars or {}).items():
+                self.inventory.set_variable(host_name, varname, value)
+        # --
+
+        meta = self.read_meta(path)
+
+        if meta.get('inventory_file') and meta.get('inventory_dir'):
+            for host_name in hosts_done:
+                self.inventory.set_variable(host_name, 'inventory_file', meta['inventory_file'])
+                self.inventory.set_variable(host_name, 'inventory_dir', meta['inventory_dir'])
+        # --
+    # --- end of parse (...) ---
+
+# --- end of InventoryModule ---
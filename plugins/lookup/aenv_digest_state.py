@@ -0,0 +1,113 @@
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+# Python >= 3.7 only
+
+# Reads item digests recorded on the control node by a previous run,
+# see the aenv_items_digest / aenv_digest_delta filters.
+#
+# Digest files are stored per host:
+#
+#   <ctrl_local_tmp>/aenv_digests/<inventory_hostname>/<name>.json
+#
+# Usage:
+#   lookup('aenv_digest_state', '<name>' [, host=<host>] [, dir=<dir>] [, path=true])
+#
+#   - host: defaults to inventory_hostname
+#   - dir:  base directory, defaults to <ctrl_local_tmp>/aenv_digests
+#   - path: return the path to the digest file (e.g. for copy: dest=...)
+#           instead of reading it
+#
+# Missing digest files result in an empty dict.
+# Writing the digest file is left to the play (copy task on localhost),
+# so that digests get recorded only after successful runs.
+#
+
+import json
+import os.path
+import re
+
+from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.lookup import LookupBase
+
+
+class LookupModule(LookupBase):
+
+    NAME_RE = re.compile(r'^[a-zA-Z0-9_\-][a-zA-Z0-9_.\-]*$')
+
+    def get_var(self, variables, varname):
+        try:
+            value = variables[varname]
+        except (KeyError, TypeError):
+            raise AnsibleError(f'aenv_digest_state: {varname} is not defined')
+        else:
+            return self._templar.template(value)
+    # --- end of get_var (...) ---
+
+    def run(self, terms, variables=None, **kwargs):
+        host       = kwargs.get('host') or self.get_var(variables, 'inventory_hostname')
+        digest_dir = kwargs.get('dir')
+        want_path  = boolean(kwargs.get('path', False), strict=False)
+
+        if not digest_dir:
+            digest_dir = os.path.join(
+                self.get_var(variables, 'ctrl_local_tmp'), 'aenv_digests'
+            )
+        # --
+
+        if not self.NAME_RE.match(host):
+            raise AnsibleError(f'aenv_digest_state: invalid host name: {host!r}')
+        # --
+
+        ret = []
+
+        for name in terms:
+            if not self.NAME_RE.match(name):
+                raise AnsibleError(f'aenv_digest_state: invalid name: {name!r}')
+            # --
+
+            digest_file = os.path.join(digest_dir, host, f'{name}.json')
+
+            if want_path:
+                ret.append(digest_file)
+
+            else:
+                try:
+                    with open(digest_file, 'rt') as fh:
+                        digests = json.load(fh)
+
+                except FileNotFoundError:
+                    digests = {}
+
+                except ValueError as err:
+                    raise AnsibleError(
+                        f'aenv_digest_state: failed to read {digest_file}: {err}'
+                    )
+                # --
+
+                if not isinstance(digests, dict):
+                    raise AnsibleError(
+                        f'aenv_digest_state: not a dict: {digest_file}'
+                    )
+                # --
+
+                ret.append(digests)
+            # --
+        # -- end for
+
+        return ret
+    # --- end of run (...) ---
+
+# --- end of LookupModule ---
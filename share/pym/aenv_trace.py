@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# AENV_TRACE instrumentation, shared by bin/wrapper.py and share/libexec/*
+# (stdlib only, loaded via a sys.path entry relative to the script).
+#
+
+import collections
+import contextlib
+import json
+import os
+import pathlib
+import sys
+import time
+
+
+class NullTracer(object):
+    """Tracer used when AENV_TRACE is not set, does nothing."""
+
+    enabled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+    def phase(self, name):
+        return self
+
+    def event(self, event_name, **kwargs):
+        pass
+
+    def close(self):
+        pass
+# --- end of NullTracer ---
+
+
+class Tracer(object):
+    """Opt-in instrumentation, enabled by setting AENV_TRACE:
+
+      - AENV_TRACE=1 or AENV_TRACE=stderr: write to stderr
+      - AENV_TRACE=<file>: append to <file>
+
+    Writes one JSON object per line:
+    per-phase monotonic timings and stat/syscall counts
+    (os.* functions are wrapped only while tracing),
+    followed by a final event (e.g. the exec'd command line).
+
+    Python < 3.11: pathlib binds os.stat() and friends at import time
+    (pathlib._NormalAccessor), these bindings get wrapped, too.
+    """
+
+    enabled = True
+
+    COUNTED_FUNCS = [
+        'stat', 'lstat', 'scandir', 'listdir', 'readlink',
+        'open', 'mkdir', 'symlink', 'unlink', 'rename', 'replace',
+    ]
+
+    def __init__(self, prog, fh, *, close_fh=False):
+        super().__init__()
+        self.prog       = prog
+        self.fh         = fh
+        self.close_fh   = close_fh
+        self.counts     = collections.Counter()
+        self.t_start    = time.monotonic()
+        self._orig_funcs = {}
+    # --- end of __init__ (...) ---
+
+    @classmethod
+    def new_from_env(cls, prog, base_env):
+        trace_dest = base_env.get('AENV_TRACE')
+
+        if not trace_dest or trace_dest in {'0', 'no', 'false', 'off'}:
+            return NullTracer()
+
+        elif trace_dest in {'1', 'stderr'}:
+            tracer = cls(prog, sys.stderr)
+
+        else:
+            tracer = cls(prog, open(trace_dest, 'at', buffering=1), close_fh=True)
+        # --
+
+        tracer.install()
+        return tracer
+    # --- end of new_from_env (...) ---
+
+    def install(self):
+        def wrap_func(name, orig_func):
+            counts = self.counts
+
+            def counted_func(*args, **kwargs):
+                counts[name] += 1
+                return orig_func(*args, **kwargs)
+            # ---
+
+            return counted_func
+        # --- end of wrap_func (...) ---
+
+        # Python < 3.11
+        accessor_cls = getattr(pathlib, '_NormalAccessor', None)
+
+        for name in self.COUNTED_FUNCS:
+            orig_func = getattr(os, name, None)
+
+            if orig_func is None:
+                continue
+
+            counted_func = wrap_func(name, orig_func)
+
+            self._orig_funcs[(os, name)] = orig_func
+            setattr(os, name, counted_func)
+
+            if (
+                accessor_cls is not None
+                and accessor_cls.__dict__.get(name) is orig_func
+            ):
+                self._orig_funcs[(accessor_cls, name)] = orig_func
+                setattr(accessor_cls, name, staticmethod(counted_func))
+            # --
+        # --
+    # --- end of install (...) ---
+
+    def uninstall(self):
+        for (obj, name), orig_func in self._orig_funcs.items():
+            setattr(obj, name, orig_func)
+
+        self._orig_funcs.clear()
+    # --- end of uninstall (...) ---
+
+    def event(self, event_name, **kwargs):
+        data = {
+            'prog'      : self.prog,
+            'pid'       : os.getpid(),
+            'event'     : event_name,
+            'ts'        : time.time(),
+            't'         : (time.monotonic() - self.t_start),
+        }
+        data.update(kwargs)
+
+        self.fh.write(json.dumps(data, default=str) + '\n')
+        self.fh.flush()
+    # --- end of event (...) ---
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        counts_before = self.counts.copy()
+        t_phase_start = time.monotonic()
+
+        try:
+            yield self
+
+        finally:
+            duration = (time.monotonic() - t_phase_start)
+
+            self.event(
+                'phase',
+                name        = name,
+                duration    = duration,
+                syscalls    = dict(self.counts - counts_before),
+            )
+    # --- end of phase (...) ---
+
+    def close(self):
+        # may be called more than once
+        self.uninstall()
+
+        if self.close_fh and not self.fh.closed:
+            self.fh.close()
+    # --- end of close (...) ---
+
+# --- end of Tracer ---
+